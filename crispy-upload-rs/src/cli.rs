@@ -3,6 +3,7 @@
 
 //! Command-line interface definitions.
 
+use std::io::{self, BufRead, Write};
 use std::path::PathBuf;
 
 use anyhow::{bail, Result};
@@ -34,7 +35,11 @@ pub struct Cli {
 #[derive(Subcommand)]
 pub enum Commands {
     /// Get bootloader status
-    Status,
+    Status {
+        /// Print the status as a single JSON object
+        #[arg(long)]
+        json: bool,
+    },
 
     /// Upload firmware to a bank
     Upload {
@@ -69,6 +74,14 @@ pub enum Commands {
     /// Reboot the device
     Reboot,
 
+    /// Run commands read from stdin, one per line, over one connection
+    ///
+    /// Each line takes the same arguments as the subcommands above (e.g.
+    /// `set-bank 1`), split like a shell command line, so quote arguments
+    /// containing spaces. After each command, a line starting with `@ok`
+    /// or `@error` reports the result.
+    Repl,
+
     /// Convert a raw binary file to UF2 format
     #[command(name = "bin2uf2")]
     Bin2Uf2 {
@@ -99,6 +112,14 @@ fn parse_hex_u32(s: &str) -> Result<u32, String> {
     u32::from_str_radix(s, 16).map_err(|e| format!("invalid hex value: {e}"))
 }
 
+/// A command line read in REPL mode.
+#[derive(Parser)]
+#[command(no_binary_name = true)]
+struct ReplLine {
+    #[command(subcommand)]
+    command: Commands,
+}
+
 /// Execute the parsed CLI command.
 pub fn run(cli: Cli) -> Result<()> {
     match cli.command {
@@ -117,17 +138,56 @@ pub fn run(cli: Cli) -> Result<()> {
             let mut transport = Transport::new(port)?;
 
             match cmd {
-                Commands::Status => commands::status(&mut transport),
-                Commands::Upload {
-                    file,
-                    bank,
-                    version,
-                } => commands::upload(&mut transport, &file, bank, version),
-                Commands::SetBank { bank } => commands::set_bank(&mut transport, bank),
-                Commands::Wipe => commands::wipe(&mut transport),
-                Commands::Reboot => commands::reboot(&mut transport),
-                Commands::Bin2Uf2 { .. } => bail!("unreachable"),
+                Commands::Repl => repl(&mut transport),
+                cmd => execute(&mut transport, cmd),
+            }
+        }
+    }
+}
+
+/// Execute a command that talks to the bootloader.
+fn execute(transport: &mut Transport, cmd: Commands) -> Result<()> {
+    match cmd {
+        Commands::Status { json } => commands::status(transport, json),
+        Commands::Upload {
+            file,
+            bank,
+            version,
+        } => commands::upload(transport, &file, bank, version),
+        Commands::SetBank { bank } => commands::set_bank(transport, bank),
+        Commands::Wipe => commands::wipe(transport),
+        Commands::Reboot => commands::reboot(transport),
+        Commands::Bin2Uf2 { .. } | Commands::Repl => bail!("not available in REPL mode"),
+    }
+}
+
+/// Read commands from stdin until EOF, reusing the open transport.
+fn repl(transport: &mut Transport) -> Result<()> {
+    let mut stdout = io::stdout();
+
+    for line in io::stdin().lock().lines() {
+        let line = line?;
+        if line.trim().is_empty() {
+            continue;
+        }
+
+        // Quoted like a shell command line, so paths may contain spaces
+        let result = shell_words::split(&line)
+            .map_err(anyhow::Error::from)
+            .and_then(|words| ReplLine::try_parse_from(words).map_err(anyhow::Error::from))
+            .and_then(|repl_line| execute(transport, repl_line.command));
+
+        match result {
+            Ok(()) => println!("@ok"),
+            Err(e) => {
+                // Keep the result on one line; clap errors span several.
+                let message = format!("{e:#}");
+                let first = message.lines().next().unwrap_or_default();
+                println!("@error {}", first.trim_start_matches("error: "));
             }
         }
+        stdout.flush()?;
     }
+
+    Ok(())
 }
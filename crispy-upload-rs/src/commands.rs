@@ -3,8 +3,8 @@
 
 //! Command implementations for bootloader operations.
 
-use std::fs;
-use std::io::Write;
+use std::fs::{self, File};
+use std::io::{BufReader, Read, Write};
 use std::path::Path;
 
 use anyhow::{bail, Context, Result};
@@ -20,10 +20,29 @@ const CRC32: Crc<u32> = Crc::<u32>::new(&CRC_32_ISO_HDLC);
 const CHUNK_SIZE: usize = MAX_DATA_BLOCK_SIZE;
 
 /// Get and display bootloader status.
-pub fn status(transport: &mut Transport) -> Result<()> {
+pub fn status(transport: &mut Transport, json: bool) -> Result<()> {
     let response = transport.send_recv(&Command::GetStatus)?;
 
     match response {
+        Response::Status {
+            active_bank,
+            version_a,
+            version_b,
+            state,
+            bootloader_version,
+        } if json => {
+            let bootloader = match bootloader_version {
+                Some(version) => {
+                    let (major, minor, patch) = unpack_semver(version);
+                    format!("\"{}.{}.{}\"", major, minor, patch)
+                }
+                None => "null".to_string(),
+            };
+            println!(
+                "{{\"bootloader_version\":{},\"active_bank\":{},\"version_a\":{},\"version_b\":{},\"state\":\"{:?}\"}}",
+                bootloader, active_bank, version_a, version_b, state
+            );
+        }
         Response::Status {
             active_bank,
             version_a,
@@ -226,47 +245,74 @@ const UF2_MAGIC_START1: u32 = 0x9E5D5157;
 const UF2_MAGIC_END: u32 = 0x0AB16F30;
 const UF2_FLAG_FAMILY_ID: u32 = 0x00002000;
 const UF2_PAYLOAD_SIZE: usize = 256;
+const UF2_BLOCK_SIZE: usize = 512;
+const UF2_WRITE_BUFFER_SIZE: usize = 1 << 20;
 
 /// Convert a raw binary file to UF2 format.
 pub fn bin2uf2(input: &Path, output: &Path, base_address: u32, family_id: u32) -> Result<()> {
-    let data = fs::read(input).with_context(|| format!("Failed to read {}", input.display()))?;
-
-    let num_blocks = data.len().div_ceil(UF2_PAYLOAD_SIZE);
-    let mut out = Vec::with_capacity(num_blocks * 512);
-
-    for i in 0..num_blocks {
-        let offset = i * UF2_PAYLOAD_SIZE;
-        let end = (offset + UF2_PAYLOAD_SIZE).min(data.len());
-        let chunk = &data[offset..end];
-
-        // 32-byte header
-        out.extend_from_slice(&UF2_MAGIC_START0.to_le_bytes());
-        out.extend_from_slice(&UF2_MAGIC_START1.to_le_bytes());
-        out.extend_from_slice(&UF2_FLAG_FAMILY_ID.to_le_bytes());
-        out.extend_from_slice(&(base_address + offset as u32).to_le_bytes());
-        out.extend_from_slice(&(UF2_PAYLOAD_SIZE as u32).to_le_bytes());
-        out.extend_from_slice(&(i as u32).to_le_bytes());
-        out.extend_from_slice(&(num_blocks as u32).to_le_bytes());
-        out.extend_from_slice(&family_id.to_le_bytes());
-
-        // 256-byte payload (zero-padded)
-        out.extend_from_slice(chunk);
-        out.resize(out.len() + UF2_PAYLOAD_SIZE - chunk.len(), 0);
-
-        // 220-byte padding
-        out.resize(out.len() + 512 - 32 - UF2_PAYLOAD_SIZE - 4, 0);
-
-        // 4-byte footer
-        out.extend_from_slice(&UF2_MAGIC_END.to_le_bytes());
+    let file = File::open(input).with_context(|| format!("Failed to read {}", input.display()))?;
+    let size = file
+        .metadata()
+        .with_context(|| format!("Failed to read {}", input.display()))?
+        .len() as usize;
+
+    let num_blocks = size.div_ceil(UF2_PAYLOAD_SIZE);
+
+    // Header fields that are identical for every block, zeroed padding and
+    // the footer. Only the target address, block number and payload differ.
+    let mut template = [0u8; UF2_BLOCK_SIZE];
+    for (field, word) in template[..32].chunks_exact_mut(4).zip([
+        UF2_MAGIC_START0,
+        UF2_MAGIC_START1,
+        UF2_FLAG_FAMILY_ID,
+        0, // target address
+        UF2_PAYLOAD_SIZE as u32,
+        0, // block number
+        num_blocks as u32,
+        family_id,
+    ]) {
+        field.copy_from_slice(&word.to_le_bytes());
     }
+    template[UF2_BLOCK_SIZE - 4..].copy_from_slice(&UF2_MAGIC_END.to_le_bytes());
+
+    // The output buffer is a run of pre-filled blocks. Payloads are read
+    // straight into their slot and the buffer is handed to the file as-is,
+    // so block data is never copied again on its way out. The file is sized
+    // once up front instead of growing with every write.
+    let blocks_per_write = UF2_WRITE_BUFFER_SIZE / UF2_BLOCK_SIZE;
+    let mut buffer = template.repeat(blocks_per_write);
+    let mut reader = BufReader::new(file);
+    let mut out =
+        File::create(output).with_context(|| format!("Failed to write {}", output.display()))?;
+    out.set_len((num_blocks * UF2_BLOCK_SIZE) as u64)
+        .with_context(|| format!("Failed to write {}", output.display()))?;
+
+    for first in (0..num_blocks).step_by(blocks_per_write) {
+        let count = blocks_per_write.min(num_blocks - first);
+
+        for (i, block) in (first..).zip(buffer.chunks_exact_mut(UF2_BLOCK_SIZE).take(count)) {
+            let offset = i * UF2_PAYLOAD_SIZE;
+            let len = UF2_PAYLOAD_SIZE.min(size - offset);
+
+            block[12..16].copy_from_slice(&(base_address + offset as u32).to_le_bytes());
+            block[20..24].copy_from_slice(&(i as u32).to_le_bytes());
+
+            // 256-byte payload (zero-padded)
+            reader
+                .read_exact(&mut block[32..32 + len])
+                .with_context(|| format!("Failed to read {}", input.display()))?;
+            block[32 + len..32 + UF2_PAYLOAD_SIZE].fill(0);
+        }
 
-    fs::write(output, &out).with_context(|| format!("Failed to write {}", output.display()))?;
+        out.write_all(&buffer[..count * UF2_BLOCK_SIZE])
+            .with_context(|| format!("Failed to write {}", output.display()))?;
+    }
 
     println!(
         "UF2: {} ({} blocks, {} bytes)",
         output.display(),
         num_blocks,
-        data.len()
+        size
     );
 
     Ok(())
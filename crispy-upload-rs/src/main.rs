@@ -7,6 +7,7 @@
 //!   crispy-upload --port /dev/ttyACM0 status
 //!   crispy-upload --port /dev/ttyACM0 upload firmware.bin --bank 0 --fw-version 1
 //!   crispy-upload --port /dev/ttyACM0 reboot
+//!   crispy-upload --port /dev/ttyACM0 repl < commands.txt
 
 mod cli;
 mod commands;
@@ -1,21 +1,20 @@
 # SPDX-License-Identifier: MIT
 # Copyright (c) 2026 ADNT Sarl <info@adnt.io>
 
-import time
-
 import pytest
 
 from crispy_board import (
     build_packages,
     enter_update_mode_via_swd,
     find_bootloader_port,
-    flash_elf,
-    reset_device,
+    flash_elf_into_update_mode,
+    open_with_retry,
 )
+from crispy_protocol.transport import Transport
 
 
 @pytest.fixture(scope="session")
-def flashed_device(project_root, skip_flash):
+def flashed_device(project_root, skip_flash, probe_session):
     if skip_flash:
         return True
 
@@ -30,25 +29,22 @@ def flashed_device(project_root, skip_flash):
     if not bootloader_elf.exists():
         pytest.fail(f"Bootloader ELF not found: {bootloader_elf}")
 
-    if not flash_elf(bootloader_elf):
+    # Flashing also blanks the boot data, so the bootloader comes up in
+    # update mode without a second erase and reset.
+    if not flash_elf_into_update_mode(bootloader_elf):
         pytest.fail("Failed to flash bootloader")
-
-    reset_device()
-    time.sleep(2.0)
     return True
 
 
 @pytest.fixture(scope="session")
-def device_in_update_mode(flashed_device):
-    if not enter_update_mode_via_swd():
+def device_in_update_mode(flashed_device, skip_flash):
+    if skip_flash and not enter_update_mode_via_swd():
         pytest.fail("Failed to enter update mode via SWD")
     return True
 
 
 @pytest.fixture
 def transport(device_in_update_mode):
-    from crispy_protocol.transport import Transport
-
     enter_update_mode_via_swd()
 
     try:
@@ -56,7 +52,8 @@ def transport(device_in_update_mode):
     except TimeoutError:
         pytest.fail("Bootloader serial port not found after reset")
 
-    time.sleep(0.5)
-    transport = Transport(port, timeout=5.0)
+    # No settle delay: opening retries while udev or ModemManager still
+    # hold the fresh node.
+    transport = open_with_retry(lambda: Transport(port, timeout=5.0))
     yield transport
     transport.close()
@@ -36,6 +36,7 @@ def firmware_data(project_root):
     return path.read_bytes()
 
 
+@pytest.mark.timeout(300)
 class TestBuildArtifacts:
 
     def test_build_bootloader(self, project_root, skip_build):
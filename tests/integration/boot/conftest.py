@@ -3,7 +3,7 @@
 
 import pytest
 
-from crispy_board import project_root_from
+from crispy_board import project_root_from, start_probe_session, stop_probe_session
 
 
 def _option_fixture(name):
@@ -22,3 +22,19 @@ skip_flash = _option_fixture("--skip-flash")
 @pytest.fixture(scope="session")
 def project_root():
     return project_root_from(__file__)
+
+
+@pytest.fixture(scope="session")
+def probe_session():
+    """One probe-rs attach shared by every SWD helper in the session."""
+    yield start_probe_session()
+    stop_probe_session()
+
+
+@pytest.fixture(scope="session")
+def serial_pool():
+    """Serial connections kept open across tests, keyed by port."""
+    pool = {}
+    yield pool
+    for ser in pool.values():
+        ser.close()
@@ -8,23 +8,38 @@ Usage:
     cd tests/integration && uv run pytest boot/deployment/ -v --tb=short
 """
 
-import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 import pytest
-import serial
 
 from crispy_board import (
     EMBEDDED_TARGET,
     PID_BOOTLOADER,
     PID_FW_RUST,
+    UPLOAD_BINARY,
+    bin2uf2,
+    build_is_current,
+    build_key,
+    build_packages,
+    crispy_session,
     enter_update_mode_via_swd,
     erase_boot_data,
     find_firmware_port,
     flash_uf2,
+    get_serial,
+    get_status,
+    objcopy,
+    parse_status,
+    port_inode,
+    port_matches,
     project_root_from,
+    read_until,
+    record_build,
+    release_serial,
     run_crispy_upload,
     run_make,
+    wait_for_enumeration,
 )
 
 TARGET_DIR = Path(f"target/{EMBEDDED_TARGET}/release")
@@ -32,7 +47,8 @@ BOOTLOADER_UF2 = TARGET_DIR / "crispy-bootloader.uf2"
 FW_RS_BIN = TARGET_DIR / "crispy-fw-sample-rs.bin"
 FW_CPP_BIN = Path("crispy-fw-sample-cpp/build/crispy-fw-sample-cpp.bin")
 
-pytestmark = pytest.mark.deployment
+# SWD helpers (erase, mode switches, BOOTSEL) share one probe-rs attach
+pytestmark = [pytest.mark.deployment, pytest.mark.usefixtures("probe_session")]
 
 
 def _root():
@@ -45,59 +61,125 @@ def _upload(port, *args):
     return stdout + stderr
 
 
-def _assert_update_mode(output):
-    assert "updatemode" in output.lower().replace(" ", "").replace("_", ""), (
-        f"Expected UpdateMode in:\n{output}"
-    )
-
-
-def _serial_command(port, command, read_delay=1.0):
-    with serial.Serial(port, baudrate=115200, timeout=3) as ser:
-        ser.reset_input_buffer()
-        ser.write(b"\r\n")
-        time.sleep(0.5)
-        ser.reset_input_buffer()
-        ser.write(command.encode() + b"\r\n")
-        time.sleep(read_delay)
-        return ser.read(ser.in_waiting or 256).decode(errors="replace")
-
-
-def _reboot_to_bootloader(fw_port):
-    with serial.Serial(fw_port, baudrate=115200, timeout=3) as ser:
-        ser.write(b"bootload\r\n")
-        time.sleep(0.5)
-    time.sleep(3.0)
-    return find_firmware_port(pid=PID_BOOTLOADER, timeout=15.0)
+def _upload_all(port, *commands):
+    """Run consecutive crispy-upload commands over one serial connection."""
+    outputs = []
+    with crispy_session(_root(), port) as session:
+        for args in commands:
+            ok, stdout, stderr = session.cmd(*args)
+            assert ok, f"{args[0]} failed:\n{stdout}\n{stderr}"
+            outputs.append(stdout + stderr)
+    return outputs
+
+
+def _build_rust(root):
+    """Build what ``make bootloader-uf2 firmware-bin upload`` does, minus make.
+
+    Both embedded crates go through one cargo invocation. Returns the first
+    failing step's result, or the last one.
+    """
+    elf_dir = root / TARGET_DIR
+    steps = [
+        lambda: build_packages(root, ["crispy-bootloader", "crispy-fw-sample-rs"], timeout=600),
+        lambda: build_packages(root, ["crispy-upload-rs"], target=None, timeout=600),
+        lambda: objcopy(elf_dir / "crispy-bootloader", elf_dir / "crispy-bootloader.bin"),
+        lambda: objcopy(elf_dir / "crispy-fw-sample-rs", root / FW_RS_BIN),
+        lambda: bin2uf2(root, elf_dir / "crispy-bootloader.bin", root / BOOTLOADER_UF2),
+    ]
+    for step in steps:
+        result = step()
+        if result.returncode != 0:
+            break
+    return result
+
+
+def _assert_update_mode(port):
+    status = get_status(_root(), port)
+    assert status.in_update_mode, f"Expected UpdateMode, got {status}"
+
+
+def _serial_command(ser, command, expect, timeout=3.0):
+    # An empty line clears any partial input; the prompt that answers it
+    # also shows the shell is up, which replaces a fixed settle delay.
+    ser.reset_input_buffer()
+    ser.write(b"\r\n")
+    read_until(ser, b"> ", timeout)
+    ser.reset_input_buffer()
+    ser.write(command.encode() + b"\r\n")
+    needle = expect.encode()
+    response = read_until(ser, needle, timeout)
+    # Finish the matching line so failure messages show all of it
+    found = response.find(needle)
+    if found != -1 and b"\n" not in response[found:]:
+        response += read_until(ser, b"\n", timeout=0.5)
+    return response.decode(errors="replace")
+
+
+def _reboot_to_bootloader(serial_pool, fw_port):
+    stale = port_inode(fw_port)
+    ser = get_serial(serial_pool, fw_port)
+    ser.write(b"bootload\r\n")
+    # The echoed line ending means the firmware has the command
+    read_until(ser, b"bootload\r", timeout=2.0)
+    release_serial(serial_pool, fw_port)
+    return wait_for_enumeration(PID_BOOTLOADER, timeout=15.0, stale_inode=stale)
+
+
+@pytest.fixture(scope="class")
+def ports():
+    """Ports found so far in the workflow; steps that reboot the device update them."""
+    return {"bootloader": None, "fw_rs": None, "fw_cpp": None}
+
+
+def _bootloader_port(ports, timeout=15.0):
+    # Tests that reboot the device clear the entry; the check guards
+    # against a port that went away without that.
+    port = ports["bootloader"]
+    if port is None or not port_matches(port, PID_BOOTLOADER):
+        port = ports["bootloader"] = find_firmware_port(pid=PID_BOOTLOADER, timeout=timeout)
+    return port
 
 
 class TestDeployment:
 
-    bootloader_port: str = ""
-    fw_rs_port: str = ""
-    fw_cpp_port: str = ""
-
-    @classmethod
-    def _find_bootloader_port(cls, timeout: float = 15.0) -> str:
-        cls.bootloader_port = find_firmware_port(pid=PID_BOOTLOADER, timeout=timeout)
-        return cls.bootloader_port
-
     def test_01_erase_flash(self, skip_flash):
         if skip_flash:
             pytest.skip("Flash skipped")
         assert erase_boot_data(), "Failed to erase boot data via SWD"
 
+    @pytest.mark.timeout(660)
     def test_02_build_artifacts(self, skip_build):
         if skip_build:
             pytest.skip("Build skipped")
 
         root = _root()
-        result = run_make(root, "bootloader-uf2", "firmware-bin", "firmware-cpp", "upload")
-        assert result.returncode == 0, f"make failed:\n{result.stderr}"
-
-        for path in (TARGET_DIR / "crispy-bootloader", FW_RS_BIN, FW_CPP_BIN):
-            assert (root / path).exists(), f"Artifact not found: {root / path}"
-
-    def test_03_flash_bootloader_uf2(self, skip_flash):
+        artifacts = [
+            root / path
+            for path in (TARGET_DIR / "crispy-bootloader", BOOTLOADER_UF2, FW_RS_BIN,
+                         FW_CPP_BIN, UPLOAD_BINARY)
+        ]
+        # Taken before building, so edits made meanwhile force the next build
+        key = build_key(root)
+        if build_is_current(root, artifacts, key):
+            print("Sources unchanged since the last build, skipping it")
+            return
+
+        # Rust (target/) and C++ (crispy-fw-sample-cpp/build/) builds are independent
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            rust = pool.submit(_build_rust, root)
+            cpp = pool.submit(run_make, root, "firmware-cpp")
+            results = {"rust": rust.result(), "cpp": cpp.result()}
+
+        for name, result in results.items():
+            assert result.returncode == 0, (
+                f"{name} build failed ({' '.join(result.args)}):\n{result.stderr}"
+            )
+
+        for path in artifacts:
+            assert path.exists(), f"Artifact not found: {path}"
+        record_build(root, key)
+
+    def test_03_flash_bootloader_uf2(self, skip_flash, ports):
         if skip_flash:
             pytest.skip("Flash skipped")
 
@@ -105,80 +187,93 @@ class TestDeployment:
         assert uf2.exists(), f"UF2 not found: {uf2}"
         assert flash_uf2(uf2), "Failed to flash bootloader via UF2"
         assert enter_update_mode_via_swd(), "Failed to enter update mode"
-        print(f"Bootloader detected on {self._find_bootloader_port()}")
+        ports["bootloader"] = None
+        print(f"Bootloader detected on {_bootloader_port(ports)}")
 
-    def test_04_upload_fw_rs_bank_a(self):
+    @pytest.mark.dependency(name="t04_05")
+    def test_04_05_upload_both_banks(self, ports):
         assert enter_update_mode_via_swd(), "Failed to enter update mode"
-        port = self._find_bootloader_port()
-        _upload(port, "upload", str(_root() / FW_RS_BIN), "--bank", "0", "--version", "1")
-
-    def test_05_upload_fw_cpp_bank_b(self):
-        port = self._find_bootloader_port()
-        _upload(port, "upload", str(_root() / FW_CPP_BIN), "--bank", "1", "--version", "1")
+        ports["bootloader"] = None
+        port = _bootloader_port(ports)
+        _upload_all(
+            port,
+            ("upload", str(_root() / FW_RS_BIN), "--bank", "0", "--version", "1"),
+            ("upload", str(_root() / FW_CPP_BIN), "--bank", "1", "--version", "1"),
+        )
 
-    def test_06_verify_status_after_upload(self):
-        port = self._find_bootloader_port()
-        output = _upload(port, "status")
-        low = output.lower()
+    @pytest.mark.dependency(name="t06", depends=["t04_05"])
+    def test_06_verify_status_after_upload(self, ports):
+        port = _bootloader_port(ports)
+        status = get_status(_root(), port)
 
         expected_version = (_root() / "VERSION").read_text().strip()
-        assert f"bootloader:  {expected_version}" in low, f"Expected version in:\n{output}"
-        assert "version a:   1" in low, f"Expected Version A = 1 in:\n{output}"
-        assert "version b:   1" in low, f"Expected Version B = 1 in:\n{output}"
-
-    def test_07_set_bank_a_and_reboot(self):
-        port = self._find_bootloader_port()
-        _upload(port, "set-bank", "0")
-        _upload(port, "reboot")
-
-        time.sleep(3.0)
-        fw_port = find_firmware_port(pid=PID_FW_RUST, timeout=15.0)
-        TestDeployment.fw_rs_port = fw_port
-
-        time.sleep(1.0)
-        response = _serial_command(fw_port, "status")
+        assert status.bootloader_version == expected_version, f"Unexpected status: {status}"
+        assert status.version_a == 1, f"Expected Version A = 1: {status}"
+        assert status.version_b == 1, f"Expected Version B = 1: {status}"
+
+    @pytest.mark.dependency(name="t07", depends=["t06"])
+    def test_07_set_bank_a_and_reboot(self, serial_pool, ports):
+        port = _bootloader_port(ports)
+        stale = port_inode(port)
+        _upload_all(port, ("set-bank", "0"), ("reboot",))
+        ports["bootloader"] = None
+
+        fw_port = wait_for_enumeration(PID_FW_RUST, timeout=15.0, stale_inode=stale)
+        ports["fw_rs"] = fw_port
+
+        ser = get_serial(serial_pool, fw_port)
+        response = _serial_command(ser, "status", "Bank: 0")
         assert "Bank: 0" in response, f"Expected 'Bank: 0', got:\n{response}"
 
-    def test_08_fw_rs_reboot_to_bootloader(self):
-        assert TestDeployment.fw_rs_port, "Rust firmware port not set"
-        port = _reboot_to_bootloader(TestDeployment.fw_rs_port)
-        _assert_update_mode(_upload(port, "status"))
-
-    def test_09_switch_to_bank_b(self):
-        port = self._find_bootloader_port()
-        _upload(port, "set-bank", "1")
-        output = _upload(port, "status")
-        assert "active bank: 1" in output.lower(), f"Expected bank B active in:\n{output}"
-
-    def test_10_reboot_to_fw_cpp(self):
-        port = self._find_bootloader_port()
+    @pytest.mark.dependency(name="t08", depends=["t07"])
+    def test_08_fw_rs_reboot_to_bootloader(self, serial_pool, ports):
+        assert ports["fw_rs"], "Rust firmware port not set"
+        port = _reboot_to_bootloader(serial_pool, ports["fw_rs"])
+        ports["bootloader"] = port
+        _assert_update_mode(port)
+
+    @pytest.mark.dependency(name="t09", depends=["t08"])
+    def test_09_switch_to_bank_b(self, ports):
+        port = _bootloader_port(ports)
+        _, output = _upload_all(port, ("set-bank", "1"), ("status", "--json"))
+        status = parse_status(output)
+        assert status.active_bank == 1, f"Expected bank B active: {status}"
+
+    @pytest.mark.dependency(name="t10", depends=["t09"])
+    def test_10_reboot_to_fw_cpp(self, serial_pool, ports):
+        port = _bootloader_port(ports)
+        stale = port_inode(port)
         _upload(port, "reboot")
+        ports["bootloader"] = None
 
-        time.sleep(3.0)
-        fw_port = find_firmware_port(pid=PID_BOOTLOADER, timeout=15.0)
-        TestDeployment.fw_cpp_port = fw_port
+        fw_port = wait_for_enumeration(PID_BOOTLOADER, timeout=15.0, stale_inode=stale)
+        ports["fw_cpp"] = fw_port
 
-        time.sleep(1.0)
         expected_version = (_root() / "VERSION").read_text().strip()
-        version_response = _serial_command(fw_port, "version")
+        ser = get_serial(serial_pool, fw_port)
+        version_response = _serial_command(
+            ser, "version", f"Version: {expected_version}",
+        )
         assert f"Version: {expected_version}" in version_response, (
             f"Expected 'Version: {expected_version}' in:\n{version_response}"
         )
 
-        status_response = _serial_command(fw_port, "status")
+        status_response = _serial_command(ser, "status", "Bank: 1")
         assert "Bank: 1" in status_response, f"Expected 'Bank: 1', got:\n{status_response}"
 
-    def test_11_fw_cpp_reboot_to_bootloader(self):
-        assert TestDeployment.fw_cpp_port, "C++ firmware port not set"
-        port = _reboot_to_bootloader(TestDeployment.fw_cpp_port)
-        _assert_update_mode(_upload(port, "status"))
-
-    def test_12_wipe_and_verify_update_mode(self):
-        port = self._find_bootloader_port()
-        _upload(port, "wipe")
-        _upload(port, "reboot")
-
-        time.sleep(3.0)
-        port = self._find_bootloader_port(timeout=15.0)
-        time.sleep(1.0)
-        _assert_update_mode(_upload(port, "status"))
+    @pytest.mark.dependency(name="t11", depends=["t10"])
+    def test_11_fw_cpp_reboot_to_bootloader(self, serial_pool, ports):
+        assert ports["fw_cpp"], "C++ firmware port not set"
+        port = _reboot_to_bootloader(serial_pool, ports["fw_cpp"])
+        ports["bootloader"] = port
+        _assert_update_mode(port)
+
+    @pytest.mark.dependency(name="t12", depends=["t11"])
+    def test_12_wipe_and_verify_update_mode(self, ports):
+        port = _bootloader_port(ports)
+        stale = port_inode(port)
+        _upload_all(port, ("wipe",), ("reboot",))
+
+        port = wait_for_enumeration(PID_BOOTLOADER, timeout=15.0, stale_inode=stale)
+        ports["bootloader"] = port
+        _assert_update_mode(port)
@@ -6,47 +6,222 @@ Version injection tests.
 
 Verifies that the VERSION file is correctly injected into all build artifacts.
 
+Each version is built once per session into its own target directory,
+from the project-root VERSION file that `make all VERSION=...` and releases
+use. The file is rewritten for the build and restored afterwards, under a
+lock, so versions build one at a time even under pytest-xdist. Do not run
+these tests alongside the deployment tests, which read VERSION too.
+
 Usage:
-    cd tests/integration && uv run pytest boot/version/ -v
+    cd tests/integration && uv run pytest boot/version/ -v -n 2
 """
 
+import fcntl
+import mmap
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
 from pathlib import Path
 
 import pytest
 
-from crispy_board import EMBEDDED_TARGET, build_packages, project_root_from
+from crispy_board import EMBEDDED_TARGET, build_key, build_packages, cargo_env
 from crispy_board.cargo import _run
 
-RELEASE_DIR = Path(f"target/{EMBEDDED_TARGET}/release")
+# Strict X.Y.Z as parse_semver() needs, but unlike any dependency's version:
+# registry paths such as "usb-device-0.3.2" end up in the ELFs too.
+VERSIONS = ["907.613.1021", "907.613.1022"]
+EMBEDDED_BINARIES = ["crispy-bootloader", "crispy-fw-sample-rs"]
+# The CLI only has to print its version, so a dev build will do. The ELFs
+# use the shipped release profile, the one known to fit the bootloader's
+# 64 KiB flash region.
+CLI_PROFILE = "dev"
+EMBEDDED_PROFILE = "release"
+# Artifact paths relative to the target directory (dev builds go to debug/)
+CLI = Path("debug/crispy-upload")
+ARTIFACTS = {
+    binary: Path(EMBEDDED_TARGET, EMBEDDED_PROFILE, binary) for binary in EMBEDDED_BINARIES
+}
 
 pytestmark = pytest.mark.version
 
 
-class TestVersionInjection:
-
-    @pytest.fixture(autouse=True)
-    def _restore_version(self):
-        root = project_root_from(__file__)
-        original = (root / "VERSION").read_text().strip()
+def _contains(path: Path, needle: bytes) -> bool:
+    """Search *path* for *needle* through a read-only mapping."""
+    with open(path, "rb") as f:
+        try:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # An empty file cannot be mapped, and holds nothing
+            return False
+        with mm:
+            return mm.find(needle) != -1
+
+
+def _verify_all(target_dir: Path, version: str) -> dict[str, bool | None]:
+    """Scan every artifact for *version*; None marks a missing artifact."""
+    results = {}
+    for name, path in ARTIFACTS.items():
+        try:
+            results[name] = _contains(target_dir / path, version.encode())
+        except FileNotFoundError:
+            results[name] = None
+    return results
+
+
+def _mtimes(paths: list[Path]) -> list[int] | None:
+    try:
+        return [path.stat().st_mtime_ns for path in paths]
+    except FileNotFoundError:
+        return None
+
+
+@pytest.fixture(scope="session")
+def build_env(project_root):
+    env = cargo_env(project_root)
+    if "RUSTC_WRAPPER" not in env and shutil.which("sccache"):
+        # Shared by all versions and workers, so each dependency is compiled
+        # once. sccache cannot cache incremental builds, hence incremental
+        # stays off.
+        env["RUSTC_WRAPPER"] = "sccache"
+        env.setdefault("SCCACHE_DIR", str(project_root / "target" / "sccache"))
+        env["CARGO_INCREMENTAL"] = "0"
+    else:
+        # A rebuild after a source edit recompiles from cached query results
+        env["CARGO_INCREMENTAL"] = "1"
+    return env
+
+
+@pytest.fixture(scope="session")
+def cargo_config(build_env):
+    """Enable rustc's parallel front end when the toolchain is nightly."""
+    try:
+        rustc = _run(["rustc", "-V"], timeout=30, env=build_env)
+    except OSError:
+        return []
+    if "nightly" not in rustc.stdout:
+        return []
+    # cfg(all()) flags are joined with the per-target ones from
+    # .cargo/config.toml instead of replacing them, as RUSTFLAGS would.
+    threads = min(os.cpu_count() or 1, 8)
+    return [f"target.'cfg(all())'.rustflags=[\"-Zthreads={threads}\"]"]
+
+
+def _replace(path: Path, data: bytes) -> None:
+    """Swap in *data* atomically, so a build script never reads it half-written."""
+    mode = path.stat().st_mode & 0o777
+    with tempfile.NamedTemporaryFile(dir=path.parent, delete=False) as f:
+        f.write(data)
+    os.chmod(f.name, mode)
+    os.replace(f.name, path)
+
+
+@contextmanager
+def _build_lock(project_root: Path):
+    """Serialise version builds across pytest-xdist workers."""
+    path = project_root / "target" / ".version-build.lock"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
         yield
-        (root / "VERSION").write_text(original)
 
-    @pytest.mark.parametrize("version", ["0.3.2", "0.3.4"], ids=["test_01_version_032", "test_02_version_034"])
-    def test_version_injection(self, version):
-        root = project_root_from(__file__)
-        (root / "VERSION").write_text(version)
 
-        result = build_packages(root, ["crispy-upload-rs"], target=None)
-        assert result.returncode == 0, f"cargo build crispy-upload-rs failed:\n{result.stderr}"
+@contextmanager
+def _project_version(project_root: Path, version: str):
+    """Put *version* in the project's VERSION file, then restore it.
 
-        result = build_packages(root, ["crispy-bootloader", "crispy-fw-sample-rs"])
-        assert result.returncode == 0, f"cargo build embedded failed:\n{result.stderr}"
+    The original mtime comes back with the content, so build_key() and the
+    main target directory do not see a change.
+    """
+    version_file = project_root / "VERSION"
+    original = version_file.read_bytes()
+    mtime = version_file.stat().st_mtime_ns
+    _replace(version_file, version.encode())
+    try:
+        yield
+    finally:
+        _replace(version_file, original)
+        os.utime(version_file, ns=(mtime, mtime))
+
+
+@pytest.fixture(scope="session", params=VERSIONS)
+def built_version(
+    request, project_root, build_env, cargo_config, pytestconfig, skip_build,
+):
+    """Build every artifact for one version; returns (version, target dir).
+
+    Each version has its own target directory, so switching versions only
+    reruns the build scripts and relinks, instead of rebuilding everything.
+    """
+    version = request.param
+    target_dir = project_root / "target" / f"version-{version}"
+    artifacts = [target_dir / path for path in (CLI, *ARTIFACTS.values())]
+
+    # Held from the cache check on, as another worker's build changes the
+    # VERSION mtime that build_key() reads.
+    with _build_lock(project_root):
+        # Reruns with unchanged sources reuse the artifacts, unless something
+        # has rebuilt them since.
+        cache_key = f"crispy/version-build/{version}"
+        inputs = build_key(project_root)
+        stamps = _mtimes(artifacts)
+        if stamps is not None and pytestconfig.cache.get(cache_key, None) == [inputs, stamps]:
+            return version, target_dir
+        # Without a build the artifacts hold some other version, or none
+        if skip_build:
+            pytest.skip(f"Build skipped and no current {version} build")
+
+        env = {
+            **build_env,
+            "CARGO_TARGET_DIR": str(target_dir),
+            # No DWARF: it is not needed, and its paths would be scanned too
+            "CARGO_PROFILE_DEV_DEBUG": "0",
+            "CARGO_PROFILE_RELEASE_DEBUG": "0",
+        }
+        with _project_version(project_root, version):
+            result = build_packages(
+                project_root, ["crispy-upload-rs"], target=None, timeout=None, env=env,
+                config=cargo_config, profile=CLI_PROFILE,
+            )
+            if result.returncode != 0:
+                pytest.fail(f"cargo build crispy-upload-rs failed:\n{result.stderr}")
+
+            result = build_packages(
+                project_root, EMBEDDED_BINARIES, timeout=None, env=env,
+                config=cargo_config, profile=EMBEDDED_PROFILE,
+            )
+            if result.returncode != 0:
+                pytest.fail(f"cargo build embedded failed:\n{result.stderr}")
+
+        if (stamps := _mtimes(artifacts)) is not None:
+            pytestconfig.cache.set(cache_key, [inputs, stamps])
+    return version, target_dir
+
+
+@pytest.fixture(scope="session")
+def version_results(built_version):
+    version, target_dir = built_version
+    return _verify_all(target_dir, version)
+
+
+# The first test of each version also pays for its build, and under xdist
+# for waiting on the other version's; cargo gets no subprocess timeout.
+@pytest.mark.timeout(600)
+class TestVersionInjection:
 
-        cli = _run([str(root / "target/release/crispy-upload"), "--version"], timeout=10)
+    def test_cli_version(self, built_version):
+        version, target_dir = built_version
+        cli = _run([str(target_dir / CLI), "--version"], timeout=10)
         assert cli.returncode == 0, f"crispy-upload --version failed:\n{cli.stderr}"
-        assert version in cli.stdout, f"Expected '{version}' in CLI output, got: {cli.stdout.strip()}"
-
-        for binary in ("crispy-bootloader", "crispy-fw-sample-rs"):
-            path = root / RELEASE_DIR / binary
-            assert path.exists(), f"Binary not found: {path}"
-            assert version.encode() in path.read_bytes(), f"{binary} does not contain version {version}"
+        assert cli.stdout.strip() == f"crispy-upload {version}", (
+            f"Unexpected CLI version output: {cli.stdout.strip()}"
+        )
+
+    @pytest.mark.parametrize("binary", ARTIFACTS)
+    def test_artifact_version(self, built_version, version_results, binary):
+        version, target_dir = built_version
+        found = version_results[binary]
+        if found is None:
+            pytest.fail(f"Binary not found: {target_dir / ARTIFACTS[binary]}")
+        assert found, f"{binary} does not contain version {version}"
@@ -3,9 +3,7 @@
 
 import os
 
-
-def _env_bool(name: str) -> bool:
-    return os.environ.get(name, "").lower() in ("1", "true", "yes")
+from crispy_env import SKIP_BUILD, SKIP_FLASH
 
 
 def pytest_addoption(parser):
@@ -18,12 +16,12 @@ def pytest_addoption(parser):
     parser.addoption(
         "--skip-build",
         action="store_true",
-        default=_env_bool("CRISPY_SKIP_BUILD"),
+        default=SKIP_BUILD,
         help="Skip building firmware (env: CRISPY_SKIP_BUILD=1)",
     )
     parser.addoption(
         "--skip-flash",
         action="store_true",
-        default=_env_bool("CRISPY_SKIP_FLASH"),
+        default=SKIP_FLASH,
         help="Skip flashing device (env: CRISPY_SKIP_FLASH=1)",
     )
@@ -2,9 +2,20 @@
 # Copyright (c) 2026 ADNT Sarl <info@adnt.io>
 
 from crispy_board.cargo import (  # noqa: F401
+    UPLOAD_BINARY,
+    BootloaderStatus,
+    CrispyUploadSession,
+    bin2uf2,
+    build_is_current,
+    build_key,
     build_packages,
+    cargo_env,
+    crispy_session,
+    get_status,
     objcopy,
+    parse_status,
     project_root_from,
+    record_build,
     run_crispy_upload,
     run_make,
 )
@@ -16,6 +27,9 @@ from crispy_board.constants import (  # noqa: F401
     CHIP,
     DEFAULT_VID,
     EMBEDDED_TARGET,
+    FLASH_BASE,
+    FLASH_SECTOR_SIZE,
+    FLASH_SIZE,
     PID_BOOTLOADER,
     PID_FW_RUST,
     RAM_UPDATE_FLAG_ADDR,
@@ -26,12 +40,16 @@ from crispy_board.discovery import (  # noqa: F401
     find_firmware_port,
     find_rpi_rp2_mount,
     poll_until,
+    port_inode,
+    port_matches,
+    wait_for_enumeration,
 )
 from crispy_board.flash import (  # noqa: F401
     enter_update_mode_via_swd,
     erase_boot_data,
     erase_flash,
     flash_elf,
+    flash_elf_into_update_mode,
     flash_uf2,
     force_bootsel_mode,
     reset_device,
@@ -39,4 +57,17 @@ from crispy_board.flash import (  # noqa: F401
 from crispy_board.probe import ProbeResult, download_binary  # noqa: F401
 from crispy_board.probe import run as run_probe_rs  # noqa: F401
 from crispy_board.protocol import upload_firmware  # noqa: F401
-from crispy_board.serial import wait_for_serial_banner  # noqa: F401
+from crispy_board.session import (  # noqa: F401
+    ProbeSession,
+    ProbeSessionError,
+    start_probe_session,
+    stop_probe_session,
+)
+from crispy_board.serial import (  # noqa: F401
+    get_serial,
+    open_with_retry,
+    read_until,
+    release_serial,
+    wait_for_serial_banner,
+)
+from crispy_env import SKIP_BUILD, SKIP_FLASH, env_bool  # noqa: F401
@@ -1,14 +1,73 @@
 # SPDX-License-Identifier: MIT
 # Copyright (c) 2026 ADNT Sarl <info@adnt.io>
 
+import json
+import os
+import selectors
+import shlex
 import subprocess
+import tempfile
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
 from pathlib import Path
+from typing import Callable, Iterable, Iterator
 
 from crispy_board.constants import EMBEDDED_TARGET
 
+UPLOAD_BINARY = Path("target/release/crispy-upload")
+LOG_TAIL_BYTES = 16 * 1024
+BUILD_STAMP = Path("target/.crispy-build-stamp")
 
-def _run(cmd, cwd=None, timeout=120):
-    return subprocess.run(cmd, cwd=cwd, capture_output=True, text=True, timeout=timeout)
+# Inputs of the Rust and C++ builds, and directories that only hold outputs
+_SOURCE_SUFFIXES = {".rs", ".toml", ".lock", ".x", ".ld", ".c", ".cpp", ".h", ".hpp", ".cmake"}
+_SOURCE_NAMES = {"Makefile", "CMakeLists.txt", "VERSION", "build.rs"}
+_SKIP_DIRS = {"target", "build", "tests", "docs", ".git", "__pycache__"}
+# What UPLOAD_BINARY is built from: its crate, the shared crate, and VERSION
+_UPLOAD_SOURCES = ("crispy-upload-rs", "crispy-common-rs", "Cargo.toml", "VERSION")
+
+
+def _run(cmd, cwd=None, timeout=120, env=None):
+    return subprocess.run(
+        cmd, cwd=cwd, capture_output=True, text=True, timeout=timeout, env=env,
+    )
+
+
+def _run_logged(cmd, root: Path, log_name: str, env: dict[str, str], timeout=120):
+    """Run a build step with its output going to a log file instead of memory.
+
+    Logs go to ``test-logs/`` in the cargo target directory. Only when the
+    step fails is the tail of the log read back, as ``stderr``. A step that
+    times out is killed and reported the same way, with returncode -9.
+    """
+    log_path = Path(env["CARGO_TARGET_DIR"]) / "test-logs" / f"{log_name}.log"
+    log_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(log_path, "w+b") as log:
+        try:
+            returncode = subprocess.run(
+                cmd, cwd=root, stdout=log, stderr=subprocess.STDOUT, timeout=timeout, env=env,
+            ).returncode
+            header = ""
+        except subprocess.TimeoutExpired:
+            returncode = -9
+            header = f"timed out after {timeout}s\n"
+        tail = ""
+        if returncode != 0:
+            start = max(0, log.seek(0, os.SEEK_END) - LOG_TAIL_BYTES)
+            log.seek(start)
+            if start:
+                log.readline()  # skip the partial first line
+            tail = f"{header}{log.read().decode(errors='replace')}\n(full log: {log_path})"
+    return subprocess.CompletedProcess(cmd, returncode, None, tail)
+
+
+def cargo_env(root: Path, target_dir: Path | None = None) -> dict[str, str]:
+    """Environment pinning cargo's output to *target_dir* (``root/target``).
+
+    The tests look for artifacts there, and a fixed target directory keeps
+    incremental and compiler-cache keys stable between runs.
+    """
+    return {**os.environ, "CARGO_TARGET_DIR": str(target_dir or root / "target")}
 
 
 def project_root_from(reference_file: str) -> Path:
@@ -22,33 +81,254 @@ def project_root_from(reference_file: str) -> Path:
     )
 
 
+def _source_mtimes(top: Path) -> Iterator[int]:
+    """Yield the mtime of every build input under *top* (or of *top* itself)."""
+    if top.is_file():
+        yield top.stat().st_mtime_ns
+        return
+    for dirpath, dirnames, filenames in os.walk(top):
+        dirnames[:] = [d for d in dirnames if d not in _SKIP_DIRS]
+        for name in filenames:
+            if name in _SOURCE_NAMES or os.path.splitext(name)[1] in _SOURCE_SUFFIXES:
+                yield os.stat(os.path.join(dirpath, name)).st_mtime_ns
+
+
+def build_key(root: Path) -> str:
+    """Newest source mtime and source count, plus the toolchain selection."""
+    newest, count = 0, 0
+    for mtime in _source_mtimes(root):
+        newest = max(newest, mtime)
+        count += 1
+    toolchain = os.environ.get("RUSTUP_TOOLCHAIN", ""), os.environ.get("PICO_SDK_PATH", "")
+    return f"{newest}:{count}:{EMBEDDED_TARGET}:{':'.join(toolchain)}"
+
+
+def build_is_current(root: Path, artifacts: list[Path], key: str) -> bool:
+    """True if every artifact exists and was built from sources matching *key*."""
+    if not all(path.exists() for path in artifacts):
+        return False
+    try:
+        return (root / BUILD_STAMP).read_text() == key
+    except FileNotFoundError:
+        return False
+
+
+def record_build(root: Path, key: str) -> None:
+    """Remember the build_key() taken before a successful build."""
+    (root / BUILD_STAMP).write_text(key)
+
+
 def build_packages(
     root: Path,
     packages: list[str],
     target: str | None = EMBEDDED_TARGET,
-    timeout: float = 120,
+    timeout: float | None = 120,
+    env: dict[str, str] | None = None,
+    config: Iterable[str] = (),
+    profile: str = "release",
 ) -> subprocess.CompletedProcess:
-    cmd = ["cargo", "build", "--release"]
+    """Build *packages* with *profile*; *env* defaults to cargo_env(root).
+
+    Each *config* entry is passed to cargo as ``--config KEY=VALUE``.
+    """
+    cmd = ["cargo", "build", "--profile", profile]
     for pkg in packages:
         cmd += ["-p", pkg]
+    for entry in config:
+        cmd += ["--config", entry]
     if target:
         cmd += ["--target", target]
-    return _run(cmd, cwd=root, timeout=timeout)
+    return _run_logged(
+        cmd, root, "cargo-" + "-".join(packages), env or cargo_env(root), timeout=timeout,
+    )
 
 
 def run_make(root: Path, *targets: str, timeout: float = 600) -> subprocess.CompletedProcess:
-    return _run(["make"] + list(targets), cwd=root, timeout=timeout)
+    return _run_logged(
+        ["make"] + list(targets), root, "make-" + "-".join(targets), cargo_env(root),
+        timeout=timeout,
+    )
 
 
 def objcopy(elf_path: Path, bin_path: Path, timeout: float = 30) -> subprocess.CompletedProcess:
     return _run(["rust-objcopy", "-O", "binary", str(elf_path), str(bin_path)], timeout=timeout)
 
 
+def bin2uf2(
+    root: Path, bin_path: Path, uf2_path: Path, base_address: int = 0x1000_0000,
+) -> subprocess.CompletedProcess:
+    """Convert with the built host tool (see ``make bootloader-uf2``)."""
+    return _run(
+        [str(root / UPLOAD_BINARY), "bin2uf2", str(bin_path), str(uf2_path),
+         "--base-address", hex(base_address)],
+        timeout=30,
+    )
+
+
+def _upload_binary_current(project_root: Path) -> bool:
+    """True if the built host tool is newer than every source it depends on."""
+    try:
+        built = (project_root / UPLOAD_BINARY).stat().st_mtime_ns
+    except FileNotFoundError:
+        return False
+    return all(
+        mtime < built
+        for source in _UPLOAD_SOURCES
+        for mtime in _source_mtimes(project_root / source)
+    )
+
+
+def _upload_command(project_root: Path, port: str, *args: str) -> list[str]:
+    """Run the built host tool directly; cargo when it is missing or stale.
+
+    A binary older than its sources may predate commands the tests use,
+    such as repl or status --json.
+    """
+    if _upload_binary_current(project_root):
+        return [str(project_root / UPLOAD_BINARY), "--port", port, *args]
+    return ["cargo", "run", "--release", "-p", "crispy-upload-rs", "--", "--port", port, *args]
+
+
 def run_crispy_upload(
     project_root: Path, port: str, *args: str,
 ) -> tuple[bool, str, str]:
     result = _run(
-        ["cargo", "run", "--release", "-p", "crispy-upload-rs", "--", "--port", port, *args],
-        cwd=project_root, timeout=60,
+        _upload_command(project_root, port, *args), cwd=project_root, timeout=60,
+        env=cargo_env(project_root),
     )
     return result.returncode == 0, result.stdout, result.stderr
+
+
+@dataclass(frozen=True)
+class BootloaderStatus:
+    state: str
+    active_bank: int
+    version_a: int
+    version_b: int
+    bootloader_version: str | None = None
+
+    @property
+    def in_update_mode(self) -> bool:
+        return self.state == "UpdateMode"
+
+
+def parse_status(output: str) -> BootloaderStatus:
+    """Parse the line printed by ``crispy-upload status --json``."""
+    for line in reversed(output.splitlines()):
+        if line.startswith("{"):
+            return BootloaderStatus(**json.loads(line))
+    raise ValueError(f"No JSON status in output:\n{output}")
+
+
+def get_status(project_root: Path, port: str) -> BootloaderStatus:
+    ok, stdout, stderr = run_crispy_upload(project_root, port, "status", "--json")
+    if not ok:
+        raise RuntimeError(f"crispy-upload status failed:\n{stdout}\n{stderr}")
+    return parse_status(stdout)
+
+
+class CrispyUploadSession:
+    """A ``crispy-upload repl`` process holding one serial connection open."""
+
+    def __init__(self, spawn: Callable[[], subprocess.Popen], stderr):
+        self._spawn = spawn
+        self._stderr = stderr
+        self._start()
+
+    def _start(self) -> None:
+        self._stderr.seek(0)
+        self._stderr.truncate()
+        self._proc = self._spawn()
+        self._stdout = bytearray()
+        self._selector = selectors.DefaultSelector()
+        self._selector.register(self._proc.stdout, selectors.EVENT_READ)
+
+    def _readline(self, deadline: float) -> bytes:
+        """Return the next stdout line, b"" at EOF; TimeoutError past *deadline*."""
+        while (end := self._stdout.find(b"\n")) == -1:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not self._selector.select(remaining):
+                raise TimeoutError
+            chunk = os.read(self._proc.stdout.fileno(), 65536)
+            if not chunk:
+                line = bytes(self._stdout)
+                self._stdout.clear()
+                return line
+            self._stdout += chunk
+        line = bytes(self._stdout[:end + 1])
+        del self._stdout[:end + 1]
+        return line
+
+    def cmd(self, *args: str, timeout: float = 60.0) -> tuple[bool, str, str]:
+        """Run one command. Returns (ok, stdout, error) like run_crispy_upload.
+
+        A command still running after *timeout* seconds raises TimeoutError;
+        the process is restarted first, so later commands get a fresh one.
+        """
+        deadline = time.monotonic() + timeout
+        lines = []
+        try:
+            # The repl splits lines like a shell, so quoting keeps paths
+            # with spaces in one argument.
+            self._proc.stdin.write(shlex.join(args).encode() + b"\n")
+            self._proc.stdin.flush()
+        except BrokenPipeError:
+            return False, "", self._exit_message()
+        try:
+            while line := self._readline(deadline).decode(errors="replace"):
+                if line.startswith("@ok"):
+                    return True, "".join(lines), ""
+                if line.startswith("@error"):
+                    return False, "".join(lines), line.removeprefix("@error").strip()
+                lines.append(line)
+        except TimeoutError:
+            self._proc.kill()
+            self.close()
+            self._start()
+            raise TimeoutError(
+                f"crispy-upload {shlex.join(args)} did not finish within {timeout}s"
+            ) from None
+        return False, "".join(lines), self._exit_message()
+
+    def close(self) -> None:
+        self._selector.close()
+        try:
+            self._proc.stdin.close()
+        except BrokenPipeError:
+            pass
+        try:
+            self._proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self._proc.kill()
+            self._proc.wait()
+        self._proc.stdout.close()
+
+    def _exit_message(self) -> str:
+        self._proc.wait()
+        self._stderr.seek(0)
+        return f"crispy-upload exited ({self._proc.returncode}):\n{self._stderr.read()}"
+
+
+@contextmanager
+def crispy_session(project_root: Path, port: str) -> Iterator[CrispyUploadSession]:
+    """Run consecutive crispy-upload commands without reopening the port.
+
+    Example::
+
+        with crispy_session(root, port) as s:
+            s.cmd("set-bank", "1")
+            s.cmd("reboot")
+    """
+    with tempfile.TemporaryFile("w+") as stderr:
+        session = CrispyUploadSession(
+            lambda: subprocess.Popen(
+                _upload_command(project_root, port, "repl"), cwd=project_root,
+                stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=stderr,
+                env=cargo_env(project_root),
+            ),
+            stderr,
+        )
+        try:
+            yield session
+        finally:
+            session.close()
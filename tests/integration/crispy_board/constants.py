@@ -6,6 +6,9 @@ CHIP = "rp2040"
 # Memory addresses (matching crispy-common-rs/src/protocol.rs)
 RAM_UPDATE_FLAG_ADDR = 0x2003_BFF0
 RAM_UPDATE_MAGIC = 0x0FDA_7E00
+FLASH_BASE = 0x1000_0000
+FLASH_SIZE = 2 * 1024 * 1024
+FLASH_SECTOR_SIZE = 4096
 BOOT_DATA_ADDR = 0x1019_0000
 BOOT2_ADDR = 0x1000_0000
 BOOT_DATA_SECTOR_SIZE = 4096
@@ -1,9 +1,11 @@
 # SPDX-License-Identifier: MIT
 # Copyright (c) 2026 ADNT Sarl <info@adnt.io>
 
-import glob as _glob
 import json
 import os
+import select
+import socket
+import struct
 import subprocess
 import time
 from pathlib import Path
@@ -13,64 +15,167 @@ from crispy_board.constants import DEFAULT_VID, PID_BOOTLOADER
 
 T = TypeVar("T")
 
+NETLINK_KOBJECT_UEVENT = 15
+# Multicast group of events rebroadcast by udev (1 is the raw kernel one)
+UDEV_MONITOR_GROUP = 2
+UDEV_LINK_DIR = "/dev/crispy"
+
 
 def poll_until(
     predicate: Callable[[], "T | None"],
     timeout: float,
     interval: float = 0.5,
     description: str = "",
+    max_interval: "float | None" = None,
 ) -> "T":
-    """Poll *predicate* until it returns a truthy value, or raise TimeoutError."""
-    start = time.time()
-    while time.time() - start < timeout:
+    """Poll *predicate* until it returns a truthy value, or raise TimeoutError.
+
+    With *max_interval*, the sleep starts at *interval* and doubles after
+    every miss up to *max_interval*, so fast events are caught early
+    without spinning for the whole timeout.
+    """
+    deadline = time.monotonic() + timeout
+    while True:
         result = predicate()
         if result is not None:
             return result
-        time.sleep(interval)
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        time.sleep(min(interval, remaining))
+        if max_interval is not None:
+            interval = min(interval * 2, max_interval)
     raise TimeoutError(
         f"{description or 'Condition'} not met within {timeout}s"
     )
 
 
-def find_rpi_rp2_mount(timeout: float = 15.0) -> Path:
-    """Wait for the RPI-RP2 mass-storage drive and return its mount point.
+def _uevent_socket() -> "socket.socket | None":
+    """Subscribe to udev events, or return None if netlink is unavailable.
 
-    Checks /proc/mounts first, then falls back to lsblk + udisksctl auto-mount.
+    The udev group rather than the raw kernel one: udev rebroadcasts an
+    event only once its rules have run, so the node's permissions and the
+    /dev/crispy links are in place by the time it arrives.
     """
+    try:
+        sock = socket.socket(
+            socket.AF_NETLINK, socket.SOCK_RAW, NETLINK_KOBJECT_UEVENT,
+        )
+    except (AttributeError, OSError):
+        return None
+    try:
+        sock.bind((0, UDEV_MONITOR_GROUP))
+    except OSError:
+        sock.close()
+        return None
+    sock.setblocking(False)
+    return sock
 
-    def _check() -> "Path | None":
-        try:
-            with open("/proc/mounts") as f:
-                for line in f:
-                    parts = line.split()
-                    if len(parts) >= 2 and "RPI-RP2" in parts[1]:
-                        return Path(parts[1])
-        except OSError:
-            pass
 
-        try:
-            result = subprocess.run(
-                ["lsblk", "-J", "-o", "NAME,LABEL,MOUNTPOINT"],
-                capture_output=True, text=True, timeout=5,
-            )
-            if result.returncode == 0:
-                data = json.loads(result.stdout)
-                for dev in _walk_lsblk(data.get("blockdevices", [])):
-                    if dev.get("label") == "RPI-RP2":
-                        mp = dev.get("mountpoint")
-                        if mp:
-                            return Path(mp)
-                        name = dev["name"]
-                        subprocess.run(
-                            ["udisksctl", "mount", "-b", f"/dev/{name}"],
-                            capture_output=True, text=True, timeout=10,
-                        )
-        except (OSError, subprocess.TimeoutExpired):
-            pass
+def _uevent_properties(msg: bytes) -> list[bytes]:
+    # udev messages carry a binary libudev header locating the KEY=VALUE list
+    if msg.startswith(b"libudev\0"):
+        offset, length = struct.unpack_from("=II", msg, 16)
+        msg = msg[offset:offset + length]
+    return msg.split(b"\0")
+
+
+def _device_added(sock: socket.socket, subsystem: bytes) -> bool:
+    """Drain pending uevents and report whether a *subsystem* device was added."""
+    key = b"SUBSYSTEM=" + subsystem
+    added = False
+    try:
+        while msg := sock.recv(8192):
+            properties = _uevent_properties(msg)
+            if b"ACTION=add" in properties and key in properties:
+                added = True
+    except BlockingIOError:
+        pass
+    except OSError:
+        # ENOBUFS: events were dropped, so one of them may have been ours
+        added = True
+    return added
+
+
+def _mountinfo_rpi_rp2(fd: int) -> "Path | None":
+    os.lseek(fd, 0, os.SEEK_SET)
+    data = b"".join(iter(lambda: os.read(fd, 65536), b""))
+    for line in data.splitlines():
+        fields = line.split()
+        if len(fields) > 4 and b"RPI-RP2" in fields[4]:
+            # A mount whose device has left sysfs belongs to a drive that
+            # went away; skip it in favour of the current one.
+            if not os.path.exists(f"/sys/dev/block/{fields[2].decode()}"):
+                continue
+            return Path(fields[4].decode().replace("\\040", " "))
+    return None
 
-        return None
 
-    return poll_until(_check, timeout, description="RPI-RP2 drive")
+def _lsblk_rpi_rp2() -> "tuple[Path | None, bool]":
+    """Return (mount point, whether a udisksctl mount was requested)."""
+    try:
+        result = subprocess.run(
+            ["lsblk", "-J", "-o", "NAME,LABEL,MOUNTPOINT"],
+            capture_output=True, text=True, timeout=5,
+        )
+        if result.returncode == 0:
+            data = json.loads(result.stdout)
+            for dev in _walk_lsblk(data.get("blockdevices", [])):
+                if dev.get("label") == "RPI-RP2":
+                    mp = dev.get("mountpoint")
+                    if mp:
+                        return Path(mp), False
+                    name = dev["name"]
+                    subprocess.run(
+                        ["udisksctl", "mount", "-b", f"/dev/{name}"],
+                        capture_output=True, text=True, timeout=10,
+                    )
+                    return None, True
+    except (OSError, subprocess.TimeoutExpired):
+        pass
+    return None, False
+
+
+def find_rpi_rp2_mount(timeout: float = 15.0) -> Path:
+    """Wait for the RPI-RP2 mass-storage drive and return its mount point.
+
+    Watches /proc/self/mountinfo for mount changes. lsblk + udisksctl
+    auto-mount is used once a block device has appeared, until a mount has
+    been requested. The result is not cached: the mount of a drive that
+    went away can linger, and would then hide the current one.
+    """
+    deadline = time.monotonic() + timeout
+    fd = os.open("/proc/self/mountinfo", os.O_RDONLY)
+    sock = _uevent_socket()
+    poller = select.poll()
+    poller.register(fd, select.POLLPRI)
+    if sock is not None:
+        poller.register(sock, select.POLLIN)
+
+    check_block = True
+    block_added = False
+    mount_requested = False
+    try:
+        while True:
+            mount = _mountinfo_rpi_rp2(fd)
+            if mount is None and check_block and not mount_requested:
+                mount, mount_requested = _lsblk_rpi_rp2()
+            if mount is not None:
+                return mount
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError(f"RPI-RP2 drive not mounted within {timeout}s")
+            events = dict(poller.poll(min(remaining, 0.5) * 1000))
+            if sock is not None and sock.fileno() in events:
+                block_added |= _device_added(sock, b"block")
+            # The labelled partition may arrive in a later event than its
+            # disk, so keep asking lsblk once a block device appeared.
+            check_block = sock is None or block_added
+    finally:
+        os.close(fd)
+        if sock is not None:
+            sock.close()
 
 
 def _walk_lsblk(devices):
@@ -81,31 +186,147 @@ def _walk_lsblk(devices):
             yield from _walk_lsblk(child.get("children", []))
 
 
-def find_firmware_port(
-    pid: str, timeout: float = 10.0, vid: str = DEFAULT_VID,
+# tty name -> (/dev inode, vid, pid). The inode changes whenever the node is
+# recreated, i.e. on every re-enumeration, so stale IDs are never returned.
+_vidpid_cache: dict[str, tuple[int, bytes, bytes]] = {}
+
+
+def _read_sysfs_id(name: str, dir_fd: int) -> bytes:
+    """Read a 4-digit hex sysfs attribute without the text I/O stack."""
+    fd = os.open(name, os.O_RDONLY, dir_fd=dir_fd)
+    try:
+        return os.read(fd, 8).rstrip()
+    finally:
+        os.close(fd)
+
+
+def _usb_ids(name: str, inode: int) -> tuple[bytes, bytes]:
+    cached = _vidpid_cache.get(name)
+    if cached is not None and cached[0] == inode:
+        return cached[1], cached[2]
+
+    # Resolve the USB device directory once for both attributes
+    dir_fd = os.open(f"/sys/class/tty/{name}/device/..", os.O_PATH | os.O_DIRECTORY)
+    try:
+        vid = _read_sysfs_id("idVendor", dir_fd)
+        pid = _read_sysfs_id("idProduct", dir_fd)
+    finally:
+        os.close(dir_fd)
+
+    _vidpid_cache[name] = (inode, vid, pid)
+    return vid, pid
+
+
+def _scan_port(vid: str, pid: str) -> "str | None":
+    # Link created by scripts/udev/99-crispy.rules, when installed
+    link = f"{UDEV_LINK_DIR}/{vid}-{pid}"
+    if os.path.exists(link):
+        return os.path.realpath(link)
+
+    with os.scandir("/dev") as entries:
+        ttys = [e for e in entries if e.name.startswith("ttyACM")]
+
+    for name in _vidpid_cache.keys() - {e.name for e in ttys}:
+        del _vidpid_cache[name]
+
+    ids = (vid.encode(), pid.encode())
+    for entry in ttys:
+        try:
+            if _usb_ids(entry.name, entry.inode()) == ids:
+                return entry.path
+        except OSError:
+            continue
+    return None
+
+
+def port_matches(port: str, pid: str, vid: str = DEFAULT_VID) -> bool:
+    """Check that *port* still exists and belongs to USB device vid:pid.
+
+    Cheaper than a rescan: one stat(), plus a sysfs read only if the node
+    was recreated since its IDs were last seen.
+    """
+    path = os.path.realpath(port)
+    try:
+        ids = _usb_ids(os.path.basename(path), os.stat(path).st_ino)
+    except OSError:
+        return False
+    return ids == (vid.encode(), pid.encode())
+
+
+def port_inode(port: "str | None") -> "int | None":
+    """Return the inode of *port*'s device node, or None if it is absent.
+
+    Read it before rebooting a device and pass it to wait_for_enumeration()
+    as *stale_inode*: a node recreated by the re-enumeration gets a new one.
+    """
+    if port is None:
+        return None
+    try:
+        return os.stat(port).st_ino
+    except OSError:
+        return None
+
+
+def wait_for_enumeration(
+    pid: str,
+    timeout: float = 10.0,
+    vid: str = DEFAULT_VID,
+    stale_inode: "int | None" = None,
 ) -> str:
-    """Find a serial port by USB VID/PID via sysfs."""
-
-    def _check() -> "str | None":
-        for port in _glob.glob("/dev/ttyACM*"):
-            try:
-                tty_name = os.path.basename(port)
-                sys_path = f"/sys/class/tty/{tty_name}/device/.."
-
-                with open(f"{sys_path}/idVendor", "r") as f:
-                    found_vid = f.read().strip()
-                with open(f"{sys_path}/idProduct", "r") as f:
-                    found_pid = f.read().strip()
-
-                if found_vid == vid and found_pid == pid:
-                    return port
-            except (FileNotFoundError, IOError):
+    """Wait for a USB serial device to enumerate and return its port.
+
+    Rescans only when udev reports a new tty device, with a periodic
+    safety scan, and falls back to short polling when netlink is
+    unavailable. *stale_inode* is the port_inode() of the instance being
+    rebooted, taken before the reboot was triggered: a port still on that
+    node is ignored, so a device still going down is not mistaken for the
+    re-enumerated one.
+
+    The port is returned only once it can be opened for reading and
+    writing. udev events already arrive after the rules have run, but the
+    safety scan can find a node udev has not finished with.
+    """
+    deadline = time.monotonic() + timeout
+    interval = 0.05
+    sock = _uevent_socket()
+    scan = True
+    try:
+        while True:
+            pending = False
+            if scan:
+                port = _scan_port(vid, pid)
+                if port is not None and (
+                    stale_inode is None or port_inode(port) != stale_inode
+                ):
+                    if os.access(port, os.R_OK | os.W_OK):
+                        return port
+                    # Permissions change without an event, so poll for them
+                    pending = True
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError(
+                    f"USB device {vid}:{pid} did not enumerate within {timeout}s"
+                )
+            if pending:
+                time.sleep(min(0.05, remaining))
+            elif sock is None:
+                time.sleep(min(interval, remaining))
+                interval = min(interval * 2, 0.5)
+            elif select.select([sock], [], [], min(remaining, 0.5))[0]:
+                scan = _device_added(sock, b"tty")
                 continue
-        return None
+            scan = True
+    finally:
+        if sock is not None:
+            sock.close()
 
-    return poll_until(
-        _check, timeout, description=f"USB device {vid}:{pid}",
-    )
+
+def find_firmware_port(
+    pid: str, timeout: float = 10.0, vid: str = DEFAULT_VID,
+) -> str:
+    """Find a serial port by USB VID/PID, waiting for it to enumerate."""
+    return wait_for_enumeration(pid, timeout=timeout, vid=vid)
 
 
 def find_bootloader_port(timeout: float = 10.0) -> str:
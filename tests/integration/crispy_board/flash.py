@@ -1,9 +1,8 @@
 # SPDX-License-Identifier: MIT
 # Copyright (c) 2026 ADNT Sarl <info@adnt.io>
 
+import os
 import shutil
-import subprocess
-import time
 from pathlib import Path
 
 from crispy_board.constants import (
@@ -12,16 +11,34 @@ from crispy_board.constants import (
     BOOT_DATA_ADDR,
     BOOT_DATA_SECTOR_SIZE,
     CHIP,
+    DEFAULT_VID,
+    PID_BOOTLOADER,
     RAM_UPDATE_FLAG_ADDR,
     RAM_UPDATE_MAGIC,
 )
-from crispy_board.discovery import find_rpi_rp2_mount
-from crispy_board.probe import download_binary, run
+from crispy_board.discovery import (
+    _scan_port,
+    find_rpi_rp2_mount,
+    poll_until,
+    port_inode,
+    wait_for_enumeration,
+)
+from crispy_board.probe import ProbeResult, download_binary, run
+from crispy_board.session import (
+    ProbeSession,
+    ProbeSessionError,
+    elf_load_segments,
+    in_session,
+    released_probe,
+)
 
 
 def flash_elf(elf_path: Path) -> bool:
     print(f"Flashing {elf_path} via SWD...")
-    result = run("download", "--chip", CHIP, str(elf_path))
+    result = (
+        in_session(lambda s: s.download_elf(elf_path))
+        or run("download", "--chip", CHIP, str(elf_path))
+    )
     if not result.success:
         print(f"Flash failed: {result.output}")
     return result.success
@@ -29,19 +46,48 @@ def flash_elf(elf_path: Path) -> bool:
 
 def erase_flash() -> bool:
     print("Erasing flash...")
-    result = run("erase", "--chip", CHIP)
+    # A chip erase beats streaming 2 MiB of 0xFF through the session
+    with released_probe():
+        result = run("erase", "--chip", CHIP)
     if not result.success:
         print(f"Erase failed: {result.output}")
     return result.success
 
 
+def _reset() -> ProbeResult:
+    return in_session(lambda s: s.reset()) or run("reset", "--chip", CHIP)
+
+
+def _write32(address: int, value: int) -> ProbeResult:
+    return in_session(lambda s: s.write32(address, value)) or run(
+        "write", "--chip", CHIP, "b32", hex(address), hex(value),
+    )
+
+
 def reset_device() -> bool:
-    return run("reset", "--chip", CHIP).success
+    return _reset().success
+
+
+_BLANK_BOOT_DATA = b"\xFF" * BOOT_DATA_SECTOR_SIZE
+
+
+def _check_boot_data_blank(session: ProbeSession) -> None:
+    # Read back: without this a no-op flash pass would leave the old
+    # boot data in place and the bootloader would silently boot it.
+    if session.read(BOOT_DATA_ADDR, BOOT_DATA_SECTOR_SIZE) != _BLANK_BOOT_DATA:
+        raise ProbeSessionError("boot data sector is not blank after erase")
+
+
+def _blank_boot_data(session: ProbeSession) -> None:
+    session.flash(BOOT_DATA_ADDR, _BLANK_BOOT_DATA)
+    _check_boot_data_blank(session)
 
 
 def erase_boot_data() -> bool:
-    result = download_binary(
-        b"\xFF" * BOOT_DATA_SECTOR_SIZE, BOOT_DATA_ADDR,
+    """Erase the boot data sector, leaving it blank (0xFF)."""
+    result = (
+        in_session(_blank_boot_data)
+        or download_binary(_BLANK_BOOT_DATA, BOOT_DATA_ADDR)
     )
     if not result.success:
         print(f"Failed to erase boot data: {result.output}")
@@ -49,24 +95,53 @@ def erase_boot_data() -> bool:
 
 
 def enter_update_mode_via_swd() -> bool:
-    """Erase boot data + write RAM magic + reset to enter update mode."""
+    """Erase boot data (or write RAM magic) + reset to enter update mode."""
     print("Entering update mode via SWD...")
 
+    # Blank boot data alone keeps the bootloader in update mode; the RAM
+    # magic is only a fallback since it may not survive the race with reset.
     if not erase_boot_data():
         print("Warning: failed to erase boot data, trying magic only")
+        _write32(RAM_UPDATE_FLAG_ADDR, RAM_UPDATE_MAGIC)
 
-    # RAM magic may or may not survive the race with reset
-    run(
-        "write", "--chip", CHIP, "b32",
-        hex(RAM_UPDATE_FLAG_ADDR), hex(RAM_UPDATE_MAGIC),
-    )
-
-    result = run("reset", "--chip", CHIP)
+    # Taken before the reset, which may recreate the node at any moment
+    stale = port_inode(_scan_port(DEFAULT_VID, PID_BOOTLOADER))
+    result = _reset()
     if not result.success:
         print(f"Failed to reset: {result.output}")
         return False
 
-    time.sleep(3.0)
+    try:
+        wait_for_enumeration(PID_BOOTLOADER, timeout=10.0, stale_inode=stale)
+    except TimeoutError as e:
+        print(e)
+        return False
+    return True
+
+
+def flash_elf_into_update_mode(elf_path: Path) -> bool:
+    """Flash *elf_path*, blank the boot data and reset into update mode.
+
+    With a probe session this is a single program pass, the boot data
+    sector written as 0xFF alongside the ELF, and one reset; otherwise it
+    falls back to flash_elf() + enter_update_mode_via_swd().
+    """
+    print(f"Flashing {elf_path} and entering update mode via SWD...")
+
+    def _prepare(session: ProbeSession) -> None:
+        session.program(elf_load_segments(elf_path) + [(BOOT_DATA_ADDR, _BLANK_BOOT_DATA)])
+        _check_boot_data_blank(session)
+        session.reset()
+
+    stale = port_inode(_scan_port(DEFAULT_VID, PID_BOOTLOADER))
+    if in_session(_prepare) is None:
+        return flash_elf(elf_path) and enter_update_mode_via_swd()
+
+    try:
+        wait_for_enumeration(PID_BOOTLOADER, timeout=10.0, stale_inode=stale)
+    except TimeoutError as e:
+        print(e)
+        return False
     return True
 
 
@@ -74,6 +149,13 @@ def force_bootsel_mode() -> bool:
     """Invalidate boot2 (first 256 bytes) via SWD so ROM enters BOOTSEL."""
     print("Forcing BOOTSEL mode (invalidating boot2 via SWD)...")
 
+    def _invalidate(session: ProbeSession) -> None:
+        session.flash(BOOT2_ADDR, b"\x00" * BOOT2_SIZE)
+        session.reset()
+
+    if in_session(_invalidate) is not None:
+        return True
+
     result = download_binary(b"\x00" * BOOT2_SIZE, BOOT2_ADDR)
     if not result.success:
         print(f"Failed to invalidate boot2: {result.output}")
@@ -92,18 +174,32 @@ def flash_uf2(uf2_path: Path, timeout: float = 15.0) -> bool:
     if not force_bootsel_mode():
         return False
 
-    time.sleep(2.0)
-
     try:
         mount = find_rpi_rp2_mount(timeout=timeout)
     except TimeoutError:
         print("RPI-RP2 mass-storage not found")
         return False
 
+    # The ROM reboots once the last block is written; its block device
+    # disappearing from sysfs marks that, even if the mount lingers.
+    dev = os.stat(mount).st_dev
+    sysfs_dev = Path(f"/sys/dev/block/{os.major(dev)}:{os.minor(dev)}")
+
     print(f"Copying {uf2_path.name} to {mount} ...")
-    shutil.copy2(str(uf2_path), str(mount / uf2_path.name))
-    subprocess.run(["sync"], check=True)
+    # fsync flushes just this file to the drive, not every dirty page
+    # on the host as a global sync would.
+    with open(uf2_path, "rb") as src, open(mount / uf2_path.name, "wb") as dst:
+        shutil.copyfileobj(src, dst, 1 << 20)
+        dst.flush()
+        os.fsync(dst.fileno())
 
     print("UF2 copied — waiting for device reboot ...")
-    time.sleep(3.0)
+    try:
+        poll_until(
+            lambda: None if sysfs_dev.exists() else True,
+            timeout=timeout, interval=0.05, max_interval=0.5,
+            description="RPI-RP2 drive removal",
+        )
+    except TimeoutError as e:
+        print(e)
     return True
@@ -1,6 +1,8 @@
 # SPDX-License-Identifier: MIT
 # Copyright (c) 2026 ADNT Sarl <info@adnt.io>
 
+import hashlib
+import os
 import subprocess
 import tempfile
 from dataclasses import dataclass
@@ -26,20 +28,42 @@ def run(*args: str, timeout: float = 30.0) -> ProbeResult:
     )
 
 
+def _cache_dir() -> Path:
+    base = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+    path = Path(base) / "crispy"
+    path.mkdir(mode=0o700, parents=True, exist_ok=True)
+    return path
+
+
+def _payload_file(data: bytes) -> Path:
+    """Return a file holding *data*, named after its hash and reused.
+
+    The payloads written here are constants (blank boot data, zeroed
+    boot2), so each is materialised once per machine rather than per call,
+    which also keeps the probe-rs command line identical between calls.
+    It lives in the per-user cache directory, and its content is compared
+    before reuse, so a truncated or altered file is rewritten, not flashed.
+    """
+    path = _cache_dir() / f"payload-{hashlib.sha256(data).hexdigest()[:16]}.bin"
+    try:
+        if path.read_bytes() == data:
+            return path
+    except FileNotFoundError:
+        pass
+    with tempfile.NamedTemporaryFile(dir=path.parent, delete=False) as f:
+        f.write(data)
+    os.replace(f.name, path)
+    return path
+
+
 def download_binary(
     data: bytes, base_address: int, timeout: float = 30.0,
 ) -> ProbeResult:
-    """Write binary data to flash via a temp file and probe-rs download."""
-    with tempfile.NamedTemporaryFile(suffix=".bin", delete=False) as f:
-        f.write(data)
-        tmp_path = f.name
-    try:
-        return run(
-            "download", "--chip", CHIP,
-            "--binary-format", "bin",
-            "--base-address", hex(base_address),
-            tmp_path,
-            timeout=timeout,
-        )
-    finally:
-        Path(tmp_path).unlink(missing_ok=True)
+    """Write binary data to flash via probe-rs download."""
+    return run(
+        "download", "--chip", CHIP,
+        "--binary-format", "bin",
+        "--base-address", hex(base_address),
+        str(_payload_file(data)),
+        timeout=timeout,
+    )
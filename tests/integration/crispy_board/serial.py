@@ -1,23 +1,100 @@
 # SPDX-License-Identifier: MIT
 # Copyright (c) 2026 ADNT Sarl <info@adnt.io>
 
+import errno
+import os
 import serial
 import time
+from collections.abc import Callable
+from typing import TypeVar
+
+T = TypeVar("T")
+
+# Open errors while udev rules or ModemManager still hold a fresh node
+_TRANSIENT_OPEN_ERRORS = {errno.EBUSY, errno.EACCES, errno.EPERM}
+
+
+def _tune_latency(port: str) -> None:
+    """Set the USB serial latency timer to 1 ms where the driver exposes it.
+
+    Best effort: usb-serial adapters (FTDI and similar) have the attribute,
+    CDC-ACM devices such as the RP2040 do not, and it may not be writable.
+    """
+    name = os.path.basename(os.path.realpath(port))
+    try:
+        with open(f"/sys/class/tty/{name}/device/latency_timer", "w") as f:
+            f.write("1")
+    except OSError:
+        pass
+
+
+def open_with_retry(opener: Callable[[], T], timeout: float = 2.0) -> T:
+    """Call *opener*, retrying while the port is transiently busy or denied.
+
+    A node that has just enumerated can still be probed by ModemManager
+    (EBUSY) or wait for udev to set its permissions (EACCES); both clear
+    within moments. Other errors, and these past *timeout*, are raised.
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            return opener()
+        except OSError as e:  # serial.SerialException included
+            if e.errno not in _TRANSIENT_OPEN_ERRORS or time.monotonic() >= deadline:
+                raise
+        time.sleep(0.05)
+
+
+def read_until(ser: serial.Serial, needle: bytes, timeout: float) -> bytes:
+    """Read from *ser* until *needle* is seen or *timeout* expires.
+
+    Drains whatever is already buffered on each pass and otherwise waits on
+    a short per-read timeout, so the call returns as soon as the response
+    arrives. Only the newly read bytes (plus an overlap for a needle split
+    across reads) are searched. Returns everything read, whether or not
+    *needle* was found.
+    """
+    ser.timeout = 0.05
+    deadline = time.monotonic() + timeout
+    buf = bytearray()
+    while time.monotonic() < deadline:
+        chunk = ser.read(ser.in_waiting or 1)
+        if chunk:
+            start = max(0, len(buf) - len(needle) + 1)
+            buf += chunk
+            if buf.find(needle, start) != -1:
+                break
+    return bytes(buf)
+
+
+def get_serial(pool: dict[str, serial.Serial], port: str) -> serial.Serial:
+    """Return the open connection to *port* from *pool*, opening it if needed."""
+    ser = pool.get(port)
+    if ser is None or not ser.is_open:
+        _tune_latency(port)
+        ser = pool[port] = open_with_retry(
+            lambda: serial.Serial(port, baudrate=115200, timeout=0.05),
+        )
+    return ser
+
+
+def release_serial(pool: dict[str, serial.Serial], port: str) -> None:
+    """Close and forget *port*, e.g. before the device behind it reboots."""
+    ser = pool.pop(port, None)
+    if ser is not None:
+        ser.close()
 
 
 def wait_for_serial_banner(
     port: str, expected_text: str, timeout: float = 10.0,
 ) -> str:
     """Read from serial port until *expected_text* appears or timeout."""
-    start = time.time()
-    buf = ""
-    with serial.Serial(port, baudrate=115200, timeout=1) as ser:
-        while time.time() - start < timeout:
-            raw = ser.read(ser.in_waiting or 1)
-            if raw:
-                buf += raw.decode(errors="replace")
-                if expected_text in buf:
-                    return buf
+    needle = expected_text.encode()
+    _tune_latency(port)
+    with open_with_retry(lambda: serial.Serial(port, baudrate=115200, timeout=0.05)) as ser:
+        buf = read_until(ser, needle, timeout)
+    if needle in buf:
+        return buf.decode(errors="replace")
     raise TimeoutError(
         f"Banner '{expected_text}' not found on {port} within {timeout}s"
     )
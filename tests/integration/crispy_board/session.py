@@ -0,0 +1,313 @@
+# SPDX-License-Identifier: MIT
+# Copyright (c) 2026 ADNT Sarl <info@adnt.io>
+
+"""Persistent probe-rs session driven over the GDB remote serial protocol.
+
+Every ``probe-rs`` CLI call pays process start-up plus a full probe attach.
+A session starts ``probe-rs gdb`` once and sends memory writes, flash
+programming and resets over a single TCP connection instead.
+"""
+
+import socket
+import struct
+import subprocess
+import time
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from pathlib import Path
+
+from crispy_board.constants import CHIP, FLASH_BASE, FLASH_SECTOR_SIZE, FLASH_SIZE
+from crispy_board.probe import ProbeResult
+
+PT_LOAD = 1
+
+
+class ProbeSessionError(Exception):
+    pass
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _escape(data: bytes) -> bytes:
+    out = bytearray()
+    for b in data:
+        if b in b"#$}*":
+            out += bytes((0x7D, b ^ 0x20))
+        else:
+            out.append(b)
+    return bytes(out)
+
+
+def elf_load_segments(elf_path: Path) -> list[tuple[int, bytes]]:
+    """Return (load address, data) for each non-empty PT_LOAD segment."""
+    elf = elf_path.read_bytes()
+    if elf[:4] != b"\x7fELF" or elf[4] != 1 or elf[5] != 1:
+        raise ProbeSessionError(f"{elf_path} is not a little-endian ELF32 file")
+
+    phoff, = struct.unpack_from("<I", elf, 28)
+    phentsize, phnum = struct.unpack_from("<HH", elf, 42)
+
+    segments = []
+    for i in range(phnum):
+        p_type, p_offset, _, p_paddr, p_filesz = struct.unpack_from(
+            "<5I", elf, phoff + i * phentsize,
+        )
+        if p_type == PT_LOAD and p_filesz:
+            segments.append((p_paddr, elf[p_offset:p_offset + p_filesz]))
+    return segments
+
+
+class ProbeSession:
+    """A ``probe-rs gdb`` server process and the RSP connection to it."""
+
+    def __init__(self, chip: str = CHIP, timeout: float = 30.0):
+        self.chip = chip
+        self.timeout = timeout
+        self._proc: subprocess.Popen | None = None
+        self._sock: socket.socket | None = None
+        self._rx = bytearray()
+        self._running = False
+
+    def connect(self) -> None:
+        port = _free_port()
+        self._proc = subprocess.Popen(
+            ["probe-rs", "gdb", "--chip", self.chip,
+             "--gdb-connection-string", f"127.0.0.1:{port}"],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        deadline = time.monotonic() + self.timeout
+        while True:
+            try:
+                self._sock = socket.create_connection(("127.0.0.1", port), timeout=1.0)
+                break
+            except OSError:
+                if self._proc.poll() is not None or time.monotonic() > deadline:
+                    self.close()
+                    raise ProbeSessionError("probe-rs gdb server did not start")
+                time.sleep(0.1)
+        self._sock.settimeout(self.timeout)
+        self._rx.clear()
+        self._running = False
+        self._command(b"?")
+
+    def close(self) -> None:
+        if self._sock is not None:
+            try:
+                self._halt()
+                self._send(b"D")
+            except (OSError, ProbeSessionError):
+                pass
+            self._sock.close()
+            self._sock = None
+        if self._proc is not None:
+            self._proc.terminate()
+            try:
+                self._proc.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self._proc.kill()
+            self._proc = None
+
+    def reconnect(self) -> None:
+        self.close()
+        self.connect()
+
+    # -- GDB remote serial protocol ------------------------------------
+
+    def _send(self, payload: bytes) -> None:
+        checksum = sum(payload) & 0xFF
+        self._sock.sendall(b"$" + payload + b"#%02x" % checksum)
+        while True:
+            ack = self._read(1)
+            if ack == b"+":
+                return
+            if ack == b"-":
+                self._sock.sendall(b"$" + payload + b"#%02x" % checksum)
+
+    def _read(self, n: int) -> bytes:
+        while len(self._rx) < n:
+            chunk = self._sock.recv(4096)
+            if not chunk:
+                raise ProbeSessionError("probe-rs gdb server closed the connection")
+            self._rx += chunk
+        data = bytes(self._rx[:n])
+        del self._rx[:n]
+        return data
+
+    def _receive(self) -> bytes:
+        while self._read(1) != b"$":
+            pass
+        payload = bytearray()
+        while (c := self._read(1)) != b"#":
+            payload += c
+        self._read(2)
+        self._sock.sendall(b"+")
+        return bytes(payload)
+
+    def _command(self, payload: bytes) -> bytes:
+        self._send(payload)
+        return self._receive()
+
+    def _expect_ok(self, payload: bytes) -> None:
+        reply = self._command(payload)
+        if reply != b"OK":
+            raise ProbeSessionError(f"{payload[:32]!r} failed: {reply!r}")
+
+    def _monitor(self, command: str) -> None:
+        self._send(b"qRcmd," + command.encode().hex().encode())
+        while (reply := self._receive()).startswith(b"O") and reply != b"OK":
+            pass
+        if reply != b"OK":
+            raise ProbeSessionError(f"monitor {command} failed: {reply!r}")
+
+    def _halt(self) -> None:
+        if self._running:
+            self._sock.sendall(b"\x03")
+            self._receive()
+            self._running = False
+
+    # -- Operations ----------------------------------------------------
+
+    def write32(self, address: int, value: int) -> None:
+        self._halt()
+        self._expect_ok(b"M%x,4:%s" % (address, value.to_bytes(4, "little").hex().encode()))
+
+    def read(self, address: int, size: int) -> bytes:
+        self._halt()
+        data = bytearray()
+        for offset in range(0, size, 1024):
+            length = min(1024, size - offset)
+            reply = self._command(b"m%x,%x" % (address + offset, length))
+            try:
+                chunk = bytes.fromhex(reply.decode())
+            except ValueError:
+                chunk = b""
+            if len(chunk) != length:
+                raise ProbeSessionError(f"read at {address + offset:#x} failed: {reply!r}")
+            data += chunk
+        return bytes(data)
+
+    def program(self, segments: list[tuple[int, bytes]]) -> None:
+        """Erase every sector touched by *segments*, then program them.
+
+        To leave a range blank, pass it as a segment of 0xFF bytes: see
+        erase().
+        """
+        self._halt()
+        sectors = set()
+        for address, data in segments:
+            size = len(data)
+            if not FLASH_BASE <= address <= address + size <= FLASH_BASE + FLASH_SIZE:
+                raise ProbeSessionError(f"range at {address:#x} is outside flash")
+            first = address // FLASH_SECTOR_SIZE
+            last = (address + size - 1) // FLASH_SECTOR_SIZE
+            sectors.update(range(first, last + 1))
+
+        for first in sorted(s for s in sectors if s - 1 not in sectors):
+            last = first
+            while last + 1 in sectors:
+                last += 1
+            self._expect_ok(b"vFlashErase:%x,%x" % (
+                first * FLASH_SECTOR_SIZE, (last - first + 1) * FLASH_SECTOR_SIZE,
+            ))
+
+        for address, data in segments:
+            for offset in range(0, len(data), 1024):
+                chunk = data[offset:offset + 1024]
+                self._expect_ok(b"vFlashWrite:%x:" % (address + offset) + _escape(chunk))
+        self._expect_ok(b"vFlashDone")
+
+    def flash(self, address: int, data: bytes) -> None:
+        self.program([(address, data)])
+
+    def erase(self, address: int, size: int) -> None:
+        """Blank *size* bytes at *address* by programming them with 0xFF.
+
+        probe-rs runs its flash loader at vFlashDone over the sectors that
+        received vFlashWrite data only, so a bare vFlashErase may report OK
+        without erasing anything. Meant for a few sectors: a chip erase is
+        faster through the CLI, see released_probe().
+        """
+        self.flash(address, b"\xff" * size)
+
+    def download_elf(self, elf_path: Path) -> None:
+        self.program(elf_load_segments(elf_path))
+
+    def reset(self) -> None:
+        """Reset the chip and let it run (``monitor reset`` leaves it halted)."""
+        self._halt()
+        self._monitor("reset")
+        self._send(b"c")
+        self._running = True
+
+
+_session: ProbeSession | None = None
+
+
+def start_probe_session(chip: str = CHIP) -> ProbeSession | None:
+    """Start the shared session, or return None if probe-rs gdb is unavailable."""
+    global _session
+    session = ProbeSession(chip)
+    try:
+        session.connect()
+    except (OSError, ProbeSessionError) as e:
+        print(f"probe-rs session unavailable, using the CLI: {e}")
+        return None
+    _session = session
+    return session
+
+
+def stop_probe_session() -> None:
+    global _session
+    if _session is not None:
+        _session.close()
+        _session = None
+
+
+@contextmanager
+def released_probe() -> Iterator[None]:
+    """Detach the shared session around a probe-rs CLI call, then reattach.
+
+    The CLI needs the probe to itself; if reattaching fails, the session is
+    dropped and later helpers use the CLI as well.
+    """
+    if _session is None:
+        yield
+        return
+    _session.close()
+    try:
+        yield
+    finally:
+        try:
+            _session.connect()
+        except (OSError, ProbeSessionError) as e:
+            print(f"probe-rs session not restored, using the CLI: {e}")
+            stop_probe_session()
+
+
+def in_session(op: Callable[[ProbeSession], None]) -> ProbeResult | None:
+    """Run *op* on the shared session, reconnecting once on failure.
+
+    Returns None when no session is active or it could not recover; the
+    session is then closed so the caller can fall back to the probe-rs CLI.
+    """
+    if _session is None:
+        return None
+    for attempt in range(2):
+        try:
+            op(_session)
+            return ProbeResult(success=True, output="")
+        except (OSError, ProbeSessionError) as e:
+            print(f"probe-rs session error: {e}")
+            if attempt == 0:
+                try:
+                    _session.reconnect()
+                    continue
+                except (OSError, ProbeSessionError):
+                    pass
+            break
+    stop_probe_session()
+    return None
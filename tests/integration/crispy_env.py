@@ -0,0 +1,22 @@
+# SPDX-License-Identifier: MIT
+# Copyright (c) 2026 ADNT Sarl <info@adnt.io>
+
+"""Environment flags read while pytest collects options.
+
+Kept outside crispy_board so the root conftest does not import the whole
+helper package, with its serial and protocol dependencies, to read them.
+"""
+
+import os
+from functools import lru_cache
+
+
+@lru_cache(maxsize=None)
+def env_bool(name: str) -> bool:
+    """True if environment variable *name* is set to 1, true or yes."""
+    return os.environ.get(name, "").lower() in ("1", "true", "yes")
+
+
+# Defaults for --skip-build / --skip-flash
+SKIP_BUILD = env_bool("CRISPY_SKIP_BUILD")
+SKIP_FLASH = env_bool("CRISPY_SKIP_FLASH")
@@ -0,0 +1,272 @@
+# SPDX-License-Identifier: MIT
+# Copyright (c) 2026 ADNT Sarl <info@adnt.io>
+
+"""Tests for the probe-rs GDB session, against a fake RSP server."""
+
+import re
+import struct
+
+import pytest
+
+from crispy_board import session as session_module
+from crispy_board.constants import FLASH_BASE, FLASH_SECTOR_SIZE, FLASH_SIZE
+from crispy_board.session import (
+    ProbeSession,
+    ProbeSessionError,
+    _escape,
+    elf_load_segments,
+    released_probe,
+)
+
+
+def frame(payload: bytes) -> bytes:
+    return b"$" + payload + b"#%02x" % (sum(payload) & 0xFF)
+
+
+def unescape(data: bytes) -> bytes:
+    return re.sub(rb"\}(.)", lambda m: bytes((m.group(1)[0] ^ 0x20,)), data, flags=re.S)
+
+
+class FakeGdbServer:
+    """Socket stand-in that acks every packet and answers it with OK.
+
+    *replies* maps a packet prefix to the reply sent instead, or to a
+    function of the packet returning it; the first *nak* packets are
+    rejected once, so the client has to retransmit them.
+    """
+
+    def __init__(self, replies: dict[bytes, bytes] | None = None, nak: int = 0):
+        self.replies = replies or {}
+        self.nak = nak
+        self.packets: list[bytes] = []
+        self._in = bytearray()
+        self._out = bytearray()
+
+    def sendall(self, data: bytes) -> None:
+        self._in += data
+        while True:
+            self._in = self._in.lstrip(b"+")
+            match = re.match(rb"\$(.*?)#([0-9a-f]{2})", self._in, re.S)
+            if match is None:
+                return
+            payload, checksum = match.group(1), match.group(2)
+            del self._in[:match.end()]
+            assert int(checksum, 16) == sum(payload) & 0xFF
+            if self.nak:
+                self.nak -= 1
+                self._out += b"-"
+                continue
+            self.packets.append(payload)
+            reply = next(
+                (r for prefix, r in self.replies.items() if payload.startswith(prefix)),
+                b"OK",
+            )
+            if callable(reply):
+                reply = reply(payload)
+            self._out += b"+" + frame(reply)
+
+    def recv(self, size: int) -> bytes:
+        data = bytes(self._out[:size])
+        del self._out[:size]
+        return data
+
+    def flash_writes(self) -> dict[int, bytes]:
+        writes = {}
+        for packet in self.packets:
+            if packet.startswith(b"vFlashWrite:"):
+                address, _, data = packet[len(b"vFlashWrite:"):].partition(b":")
+                writes[int(address, 16)] = unescape(data)
+        return writes
+
+    def erases(self) -> list[tuple[int, int]]:
+        return [
+            tuple(int(v, 16) for v in p[len(b"vFlashErase:"):].split(b","))
+            for p in self.packets if p.startswith(b"vFlashErase:")
+        ]
+
+
+@pytest.fixture
+def server():
+    return FakeGdbServer()
+
+
+@pytest.fixture
+def session(server):
+    s = ProbeSession()
+    s._sock = server
+    return s
+
+
+def make_elf(segments: list[tuple[int, int, bytes]]) -> bytes:
+    """Build a minimal ELF32 LE file from (p_type, p_paddr, data) entries."""
+    phoff, phentsize = 52, 32
+    header = bytearray(52)
+    header[:6] = b"\x7fELF\x01\x01"
+    struct.pack_into("<I", header, 28, phoff)
+    struct.pack_into("<HH", header, 42, phentsize, len(segments))
+
+    offset = phoff + phentsize * len(segments)
+    phdrs, blobs = b"", b""
+    for p_type, p_paddr, data in segments:
+        phdrs += struct.pack(
+            "<8I", p_type, offset + len(blobs), p_paddr, p_paddr,
+            len(data), len(data), 0, 4,
+        )
+        blobs += data
+    return bytes(header) + phdrs + blobs
+
+
+class TestEscape:
+
+    def test_plain_bytes_unchanged(self):
+        assert _escape(b"abc\x00\xff") == b"abc\x00\xff"
+
+    def test_special_bytes_escaped(self):
+        assert _escape(b"#$}*") == b"}\x03}\x04}]}\x0a"
+
+    def test_roundtrip(self):
+        data = bytes(range(256))
+        assert unescape(_escape(data)) == data
+
+
+class TestElfLoadSegments:
+
+    def test_returns_non_empty_load_segments(self, tmp_path):
+        elf = tmp_path / "fw.elf"
+        elf.write_bytes(make_elf([
+            (1, 0x10000000, b"boot"),
+            (4, 0x10000100, b"note"),  # PT_NOTE
+            (1, 0x20000000, b""),      # .bss only
+            (1, 0x10000200, b"text"),
+        ]))
+        assert elf_load_segments(elf) == [(0x10000000, b"boot"), (0x10000200, b"text")]
+
+    def test_rejects_non_elf32(self, tmp_path):
+        elf = tmp_path / "fw.elf"
+        elf.write_bytes(b"\x7fELF\x02\x01" + bytes(58))
+        with pytest.raises(ProbeSessionError):
+            elf_load_segments(elf)
+
+
+class TestPacketFraming:
+
+    def test_command_returns_reply(self, server, session):
+        server.replies[b"?"] = b"S05"
+        assert session._command(b"?") == b"S05"
+        assert server.packets == [b"?"]
+
+    def test_nak_retransmits(self, session):
+        server = FakeGdbServer(nak=1)
+        session._sock = server
+        session.write32(0x20000000, 0x12345678)
+        assert server.packets == [b"M20000000,4:78563412"]
+
+    def test_error_reply_raises(self, server, session):
+        server.replies[b"M"] = b"E01"
+        with pytest.raises(ProbeSessionError):
+            session.write32(0x20000000, 1)
+
+    def test_closed_connection_raises(self, session):
+        session._sock.recv = lambda size: b""
+        with pytest.raises(ProbeSessionError):
+            session.write32(0x20000000, 1)
+
+    def test_monitor_skips_console_output(self, server, session):
+        server.replies[b"qRcmd"] = b"O" + b"resetting\n".hex().encode()
+        # The console packet comes first, OK follows as a second packet
+        sendall = server.sendall
+
+        def with_ok(data):
+            sendall(data)
+            if data.startswith(b"$qRcmd"):
+                server._out += frame(b"OK")
+
+        server.sendall = with_ok
+        session._monitor("reset")
+        assert server.packets == [b"qRcmd," + b"reset".hex().encode()]
+
+
+class TestRead:
+
+    def test_reads_in_chunks(self, server, session):
+        server.replies[b"m"] = lambda p: b"ab" * int(p.split(b",")[1], 16)
+        assert session.read(FLASH_BASE, 1500) == b"\xab" * 1500
+        assert server.packets == [b"m10000000,400", b"m10000400,1dc"]
+
+    def test_error_reply_raises(self, server, session):
+        server.replies[b"m"] = b"E14"
+        with pytest.raises(ProbeSessionError):
+            session.read(FLASH_BASE, 4)
+
+
+class TestProgram:
+
+    def test_coalesces_adjacent_sectors(self, server, session):
+        base = FLASH_BASE + 4 * FLASH_SECTOR_SIZE
+        session.program([
+            (base, b"\x01" * (FLASH_SECTOR_SIZE + 1)),  # sectors 4-5
+            (base + 2 * FLASH_SECTOR_SIZE, b"\x02"),     # sector 6
+            (base + 9 * FLASH_SECTOR_SIZE, b"\x03"),     # sector 13
+        ])
+        assert server.erases() == [
+            (base, 3 * FLASH_SECTOR_SIZE),
+            (base + 9 * FLASH_SECTOR_SIZE, FLASH_SECTOR_SIZE),
+        ]
+        assert server.packets[-1] == b"vFlashDone"
+
+    def test_writes_data_in_chunks(self, server, session):
+        data = bytes(range(256)) * 10
+        session.program([(FLASH_BASE, data)])
+        writes = server.flash_writes()
+        assert sorted(writes) == [FLASH_BASE, FLASH_BASE + 1024, FLASH_BASE + 2048]
+        assert b"".join(writes[a] for a in sorted(writes)) == data
+
+    def test_rejects_range_outside_flash(self, server, session):
+        with pytest.raises(ProbeSessionError):
+            session.program([(FLASH_BASE + FLASH_SIZE - 1, b"\x00\x00")])
+        assert server.packets == []
+
+    def test_erase_programs_ff(self, server, session):
+        session.erase(FLASH_BASE + FLASH_SECTOR_SIZE, FLASH_SECTOR_SIZE)
+        writes = server.flash_writes()
+        assert b"".join(writes.values()) == b"\xff" * FLASH_SECTOR_SIZE
+        assert server.erases() == [(FLASH_BASE + FLASH_SECTOR_SIZE, FLASH_SECTOR_SIZE)]
+        assert server.packets[-1] == b"vFlashDone"
+
+
+class FakeSession:
+
+    def __init__(self, connect_error: Exception | None = None):
+        self.calls = []
+        self.connect_error = connect_error
+
+    def close(self):
+        self.calls.append("close")
+
+    def connect(self):
+        self.calls.append("connect")
+        if self.connect_error is not None:
+            raise self.connect_error
+
+
+class TestReleasedProbe:
+
+    def test_detaches_and_reattaches(self, monkeypatch):
+        fake = FakeSession()
+        monkeypatch.setattr(session_module, "_session", fake)
+        with released_probe():
+            assert fake.calls == ["close"]
+        assert fake.calls == ["close", "connect"]
+        assert session_module._session is fake
+
+    def test_drops_session_when_reattach_fails(self, monkeypatch):
+        fake = FakeSession(connect_error=ProbeSessionError("busy"))
+        monkeypatch.setattr(session_module, "_session", fake)
+        with released_probe():
+            pass
+        assert session_module._session is None
+
+    def test_without_session(self, monkeypatch):
+        monkeypatch.setattr(session_module, "_session", None)
+        with released_probe():
+            pass